@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+AI Chatbot Batch Mode
+Runs prompts from a JSONL file (or stdin) through the chatbot with bounded
+concurrency and writes one JSON result per line, in completion order.
+
+Input lines may be JSON objects such as
+    {"id": "q1", "prompt": "What is Python?"}
+    {"id": "q2", "messages": [{"role": "user", "content": "Hi"}], "model": "70b"}
+or plain text (one prompt per line).
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import redirect_stdout
+
+from chatbot import (Chatbot, MODELS, add_cache_arguments, cache_from_args, near_cache_from_args,
+                     add_resilience_arguments, resilience_from_args,
+                     add_rate_limit_arguments, rate_limiter_from_args)
+from rate_limit import PRIORITY_BATCH
+
+
+def read_prompts(lines):
+    """Yield prompt records from JSONL (or plain text) lines"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = line
+        if isinstance(record, str):
+            record = {"prompt": record}
+        elif not isinstance(record, dict):
+            record = {"prompt": line}  # Plain text that happens to parse as JSON ("42", "null")
+        record.setdefault("id", number)
+        yield record
+
+
+def build_messages(record):
+    """Turn a prompt record into API messages"""
+    if "messages" in record:
+        return record["messages"]
+    messages = []
+    if record.get("system"):
+        messages.append({"role": "system", "content": record["system"]})
+    messages.append({"role": "user", "content": record["prompt"]})
+    return messages
+
+
+def run_prompt(chat, record, default_model=None):
+    """Run one prompt to completion and return its result record"""
+    model = record.get("model") or default_model or chat.model
+    model = MODELS.get(model, model)
+    result = {"id": record["id"], "model": model}
+    start = time.perf_counter()
+    try:
+        stream = chat.stream_completion(build_messages(record), model=model)
+        text = "".join(stream)
+        prompt_tokens, completion_tokens, estimated = stream.token_counts(text)
+        result.update({
+            "model": stream.model,
+            "response": text,
+            "ttft_s": round(stream.ttft, 4) if stream.ttft is not None else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "tokens_estimated": estimated,
+            "cached": stream.cached,
+            "similarity": stream.similarity,
+            "retries": stream.retries,
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency_s"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def run_batch(chat, records, output, concurrency=4, model=None, on_result=None):
+    """Run prompt records with at most `concurrency` streams in flight
+
+    Results are written to `output` as JSONL as soon as each one finishes.
+    Returns (succeeded, failed) counts.
+    """
+    succeeded = failed = 0
+    write_lock = threading.Lock()
+    records = iter(records)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            # Keep the pool full without reading the whole input up front
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    record = next(records)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(run_prompt, chat, record, model))
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if "error" in result:
+                    failed += 1
+                else:
+                    succeeded += 1
+                with write_lock:
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    output.flush()
+                if on_result:
+                    on_result(result)
+    return succeeded, failed
+
+
+def parse_args(argv=None):
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="Run prompts through the AI Chatbot in batch")
+    parser.add_argument("input", help="JSONL prompt file, or '-' for stdin")
+    parser.add_argument("-o", "--output", default="-",
+                        help="JSONL result file (default: stdout)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4,
+                        help="maximum concurrent in-flight requests (default: 4)")
+    parser.add_argument("-m", "--model", default=None,
+                        help=f"default model id or short name ({', '.join(MODELS)})")
+    add_cache_arguments(parser)
+    add_resilience_arguments(parser)
+    add_rate_limit_arguments(parser)
+    parser.add_argument("--metrics-file", default=None, metavar="PATH",
+                        help="write latency/throughput metrics when done "
+                             "(.json for a JSON snapshot, otherwise Prometheus text)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.concurrency < 1:
+        print("[ERROR] --concurrency must be at least 1", file=sys.stderr)
+        return 1
+
+    # Keep stdout clean for results: startup messages go to stderr
+    with redirect_stdout(sys.stderr):
+        chat = Chatbot(show_timing=False, render_mode="raw", cache=cache_from_args(args),
+                       near_cache=near_cache_from_args(args), coalesce=not args.no_coalesce,
+                       limiter=rate_limiter_from_args(args), priority=PRIORITY_BATCH,
+                       **resilience_from_args(args))
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        succeeded, failed = run_batch(chat, read_prompts(source), output,
+                                      concurrency=args.concurrency, model=args.model)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    total = succeeded + failed
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"[DONE] {succeeded} succeeded, {failed} failed in {elapsed:.1f}s ({rate:.2f} prompts/s)",
+          file=sys.stderr)
+    if args.metrics_file:
+        chat.metrics.write(args.metrics_file)
+    if chat.cache is not None:
+        stats = chat.cache.stats()
+        print(f"[CACHE] {stats['hits']} hits, {stats['misses']} misses "
+              f"(hit rate {stats['hit_rate']:.0%})", file=sys.stderr)
+        chat.cache.close()
+    if chat.near_cache is not None:
+        stats = chat.near_cache.stats()
+        print(f"[CACHE] {stats['hits']} answers reused for similar prompts "
+              f"(hit rate {stats['hit_rate']:.0%}, mean similarity {stats['mean_similarity']:.0%})",
+              file=sys.stderr)
+    if chat.flights is not None and chat.flights.coalesced:
+        stats = chat.flights.stats()
+        print(f"[COALESCE] {stats['coalesced']} duplicate prompts shared "
+              f"{stats['upstream']} upstream streams", file=sys.stderr)
+    return 0 if failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+AI Chatbot Benchmarks
+Measures the client's own overhead offline, against a local mock of the
+Together.ai (OpenAI-compatible) streaming API.
+
+    python benchmark.py                          # run everything, print a report
+    python benchmark.py --save-baseline base.json
+    python benchmark.py --compare base.json      # exit 1 on regressions
+    python benchmark.py --serve-mock --port 9000 --first-token 0.2 --error-rate 0.05
+
+The mock server runs in a separate process so its CPU time is not charged to
+the client.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_TEXT = ("Sure — here’s a “quick” answer… Python is a high-level language. "
+             "It is easy to read 🚀 and great for scripting, data work and the web. ")
+
+
+# Mock provider
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    """OpenAI/Together-compatible /chat/completions endpoint with tunable streaming"""
+
+    protocol_version = "HTTP/1.1"
+    config = {
+        "first_token": 0.05,     # seconds before the first chunk
+        "chunk_chars": 8,        # characters per streamed chunk
+        "chunk_rate": 200.0,     # chunks per second
+        "response_chars": 800,   # length of each response
+        "error_rate": 0.0,       # fraction of requests answered with an error status
+        "error_status": 503,
+        "drop_rate": 0.0,        # fraction of streams cut off half-way
+    }
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        config = self.config
+        if random.random() < config["error_rate"]:
+            self._send_json(config["error_status"], {"error": {"message": "injected error"}})
+            return
+
+        model = request.get("model", "mock")
+        text = (MOCK_TEXT * (config["response_chars"] // len(MOCK_TEXT) + 1))[:config["response_chars"]]
+        if not request.get("stream"):
+            time.sleep(config["first_token"])
+            self._send_json(200, {
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+                "usage": self._usage(request, text),
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(config["first_token"])
+        step = config["chunk_chars"]
+        interval = 1.0 / config["chunk_rate"] if config["chunk_rate"] > 0 else 0.0
+        drop_at = len(text) // 2 if random.random() < config["drop_rate"] else None
+        try:
+            for start in range(0, len(text), step):
+                if drop_at is not None and start >= drop_at:
+                    return  # Simulate a stream that dies mid-response
+                self._send_event(self._chunk(model, {"content": text[start:start + step]}))
+                if interval:
+                    time.sleep(interval)
+            final = self._chunk(model, {}, finish_reason="stop")
+            final["usage"] = self._usage(request, text)
+            self._send_event(final)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _chunk(self, model, delta, finish_reason=None):
+        return {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    def _usage(self, request, text):
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+        prompt_tokens = prompt_chars // 4 + 1
+        completion_tokens = len(text) // 4 + 1
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _send_event(self, payload):
+        self.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_mock(host, port, **config):
+    """Run the mock provider in the foreground"""
+    MockProviderHandler.config = dict(MockProviderHandler.config, **config)
+    server = ThreadingHTTPServer((host, port), MockProviderHandler)
+    server.daemon_threads = True
+    print(f"[OK] Mock provider on http://{host}:{port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@contextlib.contextmanager
+def mock_provider(args):
+    """Start the mock provider in a subprocess and yield its base URL"""
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve-mock",
+           "--host", "127.0.0.1", "--port", str(args.port)] + mock_arguments(args)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        line = process.stdout.readline()
+        if "[OK]" not in line:
+            raise RuntimeError(f"Mock provider failed to start: {line.strip()}")
+        yield f"http://127.0.0.1:{args.port}/v1"
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def mock_arguments(args):
+    return ["--first-token", str(args.first_token), "--chunk-chars", str(args.chunk_chars),
+            "--chunk-rate", str(args.chunk_rate), "--response-chars", str(args.response_chars),
+            "--error-rate", str(args.error_rate), "--drop-rate", str(args.drop_rate)]
+
+
+# Statistics
+
+def percentile(values, q):
+    """q-th percentile (0-100) with linear interpolation"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(name, values):
+    """p50/p95/p99/mean of a list of seconds, keyed with the metric name"""
+    return {
+        f"{name}_p50_s": percentile(values, 50),
+        f"{name}_p95_s": percentile(values, 95),
+        f"{name}_p99_s": percentile(values, 99),
+        f"{name}_mean_s": sum(values) / len(values) if values else 0.0,
+    }
+
+
+def timed(func, iterations):
+    """Wall-clock seconds for each of `iterations` calls"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+# Benchmarks
+
+def make_chatbot(base_url, **kwargs):
+    import chatbot
+    with contextlib.redirect_stdout(io.StringIO()):
+        return chatbot.Chatbot(show_timing=False, render_mode="raw", base_url=base_url, **kwargs)
+
+
+def bench_streaming(base_url, requests, concurrency):
+    """Streaming completions through Chatbot.stream_completion"""
+    chat = make_chatbot(base_url)
+    messages = [{"role": "user", "content": "Tell me about Python."}]
+
+    def one_request(_):
+        stream = chat.stream_completion(messages)
+        try:
+            text = "".join(stream)
+        except Exception:
+            return None
+        return stream.ttft, stream.latency, stream.completion_tokens(), len(text)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one_request, range(requests)))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    completed = [r for r in results if r is not None]
+    tokens = sum(r[2] for r in completed)
+    result = {
+        "requests": requests,
+        "errors": requests - len(completed),
+        "tokens_per_s": tokens / wall if wall > 0 else 0.0,
+        "cpu_per_token_us": cpu / tokens * 1e6 if tokens else 0.0,
+    }
+    result.update(summarize("ttft", [r[0] for r in completed if r[0] is not None]))
+    result.update(summarize("latency", [r[1] for r in completed]))
+    return result
+
+
+def bench_display(base_url, requests, render_mode):
+    """Full display_response turns (spinner, renderer, history) with output discarded"""
+    chat = make_chatbot(base_url)
+    import chatbot
+    chat.renderer = chatbot.create_renderer(render_mode)
+    sink = open(os.devnull, "w", encoding="utf-8")
+    chat.renderer.stream = sink
+    samples = []
+    cpu_start = time.process_time()
+    try:
+        with contextlib.redirect_stdout(sink):
+            for _ in range(requests):
+                chat.reset_history()
+                start = time.perf_counter()
+                chat.display_response("Tell me about Python.")
+                samples.append(time.perf_counter() - start)
+    finally:
+        sink.close()
+    cpu = time.process_time() - cpu_start
+    snapshot = chat.metrics.snapshot()["models"].get(chat.model, {})
+    tokens = snapshot.get("tokens_total", 0)
+    result = {"cpu_per_token_us": cpu / tokens * 1e6 if tokens else 0.0}
+    result.update(summarize("turn", samples))
+    render = snapshot.get("render_seconds")
+    if render:
+        result["render_mean_s"] = render["mean"]
+    return result
+
+
+def time_to_prompt(base_url, extra_args=()):
+    """Seconds to run chatbot.py up to its first prompt (stdin is closed, so it exits there)"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot.py")
+    env = dict(os.environ, TOGETHER_BASE_URL=base_url)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, script] + list(extra_args), stdin=subprocess.DEVNULL,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, check=False)
+    return time.perf_counter() - start
+
+
+def bench_startup(base_url, iterations):
+    """Banner, console probes, client construction and whole-process time to prompt"""
+    import chatbot
+    sink = io.StringIO()
+
+    def probe():
+        chatbot._console_capabilities = None
+        with contextlib.redirect_stdout(sink):
+            chatbot.detect_console_capabilities()
+
+    def banner():
+        chatbot._console_capabilities = None
+        with contextlib.redirect_stdout(sink):
+            chatbot.print_robot()
+
+    def client():
+        make_chatbot(base_url)
+
+    result = {}
+    result.update(summarize("console_probe", timed(probe, iterations)))
+    result.update(summarize("print_robot", timed(banner, iterations)))
+    result.update(summarize("client_construction", timed(client, iterations)))
+    # Whole processes are slow to start; a few runs are enough
+    runs = max(1, iterations // 4)
+    result.update(summarize("time_to_prompt",
+                            [time_to_prompt(base_url) for _ in range(runs)]))
+    result.update(summarize("time_to_prompt_fast_start",
+                            [time_to_prompt(base_url, ["--fast-start"]) for _ in range(runs)]))
+    return result
+
+
+def bench_fallback(iterations):
+    """Unicode fallback transcoding paths"""
+    import chatbot
+    text = MOCK_TEXT * 4
+    sink = io.StringIO()
+    saved = chatbot._console_capabilities
+    table = chatbot.build_fallback_table("cp1252", emoji_supported=False)
+    # Pretend to be a legacy code page console
+    chatbot._console_capabilities = {"encoding": "cp1252", "unicode": False, "emoji": False,
+                                     "lossy": True, "table": table}
+    try:
+        def transcode():
+            chatbot.to_console(text)
+
+        def safe():
+            with contextlib.redirect_stdout(sink):
+                chatbot.safe_print(text)
+
+        def full_fallback():
+            with contextlib.redirect_stdout(sink):
+                chatbot.print_with_fallback(text)
+
+        result = {}
+        result.update(summarize("to_console", timed(transcode, iterations)))
+        result.update(summarize("safe_print", timed(safe, iterations)))
+        result.update(summarize("print_with_fallback", timed(full_fallback, iterations)))
+        return result
+    finally:
+        chatbot._console_capabilities = saved
+
+
+def run_benchmarks(args):
+    # Any key works against the mock
+    os.environ.setdefault("TOGETHER_API_KEY", "mock-key")
+    results = {}
+    with mock_provider(args) as base_url:
+        print(f"[RUN] streaming ({args.requests} requests, concurrency {args.concurrency})...")
+        results["streaming"] = bench_streaming(base_url, args.requests, args.concurrency)
+        print(f"[RUN] display ({args.turns} turns, {args.render} renderer)...")
+        results["display"] = bench_display(base_url, args.turns, args.render)
+        print(f"[RUN] startup ({args.iterations} iterations)...")
+        results["startup"] = bench_startup(base_url, args.iterations)
+    print(f"[RUN] fallback printing ({args.iterations * 10} iterations)...")
+    results["fallback"] = bench_fallback(args.iterations * 10)
+    return results
+
+
+# Reporting and baselines
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+
+def compare(results, baseline, tolerance):
+    """List metrics that regressed by more than `tolerance` (fraction) against the baseline"""
+    regressions = []
+    for group, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(group, {}).get(metric)
+            if not isinstance(old, (int, float)) or not old or metric in ("requests",):
+                continue
+            change = (value - old) / old
+            if higher_is_better(metric):
+                change = -change
+            if change > tolerance:
+                regressions.append((group, metric, old, value, change))
+    return regressions
+
+
+def format_value(metric, value):
+    if metric.endswith("_s"):
+        return f"{value * 1000:.3f} ms"
+    if metric.endswith("_us"):
+        return f"{value:.1f} us"
+    if isinstance(value, float):
+        return f"{value:.1f}"
+    return str(value)
+
+
+def print_report(results):
+    for group, metrics in results.items():
+        print(f"\n{group}")
+        for metric, value in metrics.items():
+            print(f"   {metric:<34} {format_value(metric, value)}")
+
+
+def parse_args(argv=None):
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="Benchmark the AI Chatbot client offline")
+    parser.add_argument("--serve-mock", action="store_true",
+                        help="only run the mock provider (foreground)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8931)
+    mock = parser.add_argument_group("mock provider")
+    mock.add_argument("--first-token", type=float, default=0.05, help="seconds to first chunk")
+    mock.add_argument("--chunk-chars", type=int, default=8, help="characters per chunk")
+    mock.add_argument("--chunk-rate", type=float, default=200.0, help="chunks per second (0 = no delay)")
+    mock.add_argument("--response-chars", type=int, default=800, help="characters per response")
+    mock.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    mock.add_argument("--drop-rate", type=float, default=0.0, help="fraction of streams cut mid-way")
+    bench = parser.add_argument_group("benchmarks")
+    bench.add_argument("--requests", type=int, default=50, help="streaming requests")
+    bench.add_argument("--concurrency", type=int, default=4, help="concurrent streaming requests")
+    bench.add_argument("--turns", type=int, default=10, help="display_response turns")
+    bench.add_argument("--render", default="raw", help="renderer for display turns")
+    bench.add_argument("--iterations", type=int, default=20, help="startup/fallback iterations")
+    bench.add_argument("--output", metavar="PATH", help="write results as JSON")
+    bench.add_argument("--save-baseline", metavar="PATH", help="save results as a baseline")
+    bench.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    bench.add_argument("--tolerance", type=float, default=0.2,
+                       help="allowed regression before failing --compare (default: 0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve_mock:
+        serve_mock(args.host, args.port, first_token=args.first_token,
+                   chunk_chars=args.chunk_chars, chunk_rate=args.chunk_rate,
+                   response_chars=args.response_chars, error_rate=args.error_rate,
+                   drop_rate=args.drop_rate)
+        return 0
+
+    results = run_benchmarks(args)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[OK] Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n[REGRESSION] {len(regressions)} metric(s) worse than baseline "
+                  f"by more than {args.tolerance:.0%}:")
+            for group, metric, old, new, change in regressions:
+                print(f"   {group}.{metric}: {format_value(metric, old)} -> "
+                      f"{format_value(metric, new)} ({change:+.0%})")
+            return 1
+        print(f"\n[OK] No regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
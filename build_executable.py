@@ -2,12 +2,61 @@
 """
 AI Chatbot Build Script - Simple and Reliable
 Creates a standalone executable with embedded API key
+
+Build profiles (--profile):
+    onefile  one self-extracting file; unpacks itself on every launch (default)
+    onedir   a folder with the executable and its libraries; no unpacking, fastest start
+    trimmed  onedir without the packages the chatbot never imports at runtime
+    all      build each of the above and compare them
+
+Every build reports its size and its measured cold- and warm-start time to
+the first prompt.
 """
 
+import argparse
+import json
+import re
 import subprocess
 import sys
 import os
 import shutil
+import statistics
+import threading
+import time
+
+APP_NAME = 'AI_Chatbot'
+PROFILES = ['onefile', 'onedir', 'trimmed']
+
+# Standard-library packages PyInstaller may pull in that a console chat never needs
+UNUSED_STDLIB = ['tkinter', 'unittest', 'pydoc', 'pydoc_data', 'doctest', 'lib2to3',
+                 'idlelib', 'turtledemo', 'test', 'distutils', 'xmlrpc', 'pdb']
+
+# Runs the chatbot's real code paths (console probe, argument parsing, caches,
+# session store, Markdown renderer and one streamed reply from the local mock
+# provider) and prints every module that ended up imported
+RUNTIME_PROBE = r"""
+import contextlib, io, json, sys, tempfile, threading
+from http.server import ThreadingHTTPServer
+import benchmark, chatbot
+server = ThreadingHTTPServer(("127.0.0.1", 0), benchmark.MockProviderHandler)
+server.daemon_threads = True
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base_url = "http://127.0.0.1:%d/v1" % server.server_address[1]
+with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+    args = chatbot.parse_args(["--cache-file", tmp + "/cache.db", "--sessions", tmp,
+                               "--near-cache", "--render", "markdown", "--rpm", "600"])
+    chatbot.detect_console_capabilities(chatbot.console_cache_path())
+    chat = chatbot.Chatbot(render_mode=args.render, base_url=base_url,
+                           cache=chatbot.cache_from_args(args),
+                           near_cache=chatbot.near_cache_from_args(args),
+                           store=chatbot.session_store_from_args(args),
+                           router=chatbot.router_from_args(args),
+                           limiter=chatbot.rate_limiter_from_args(args))
+    chat.display_response("Hello")
+    chat.store.close()
+    chat.cache.close()
+print(json.dumps(sorted(sys.modules)))
+"""
 
 def load_api_key():
     """Load API key from .env file"""
@@ -56,73 +105,253 @@ def prepare_distribution_file(api_key):
     print("✅ Distribution file created")
     return 'chatbot_dist.py'
 
-def build_executable():
-    """Build the standalone executable"""
-    print("🔨 Building standalone executable...")
-    
-    api_key = load_api_key()
-    if not api_key:
-        return False
-    
-    dist_file = prepare_distribution_file(api_key)
-    
-    # Simple build command
+def dist_path(profile):
+    """Output folder of a profile (onefile keeps the original dist/ location)"""
+    return 'dist' if profile == 'onefile' else os.path.join('dist', profile)
+
+def executable_path(profile):
+    """Path of the built executable (.exe on Windows only)"""
+    name = APP_NAME + ('.exe' if sys.platform.startswith('win') else '')
+    if profile == 'onefile':
+        return os.path.join(dist_path(profile), name)
+    return os.path.join(dist_path(profile), APP_NAME, name)
+
+def build_size(profile):
+    """Bytes shipped: the single file, or the whole onedir folder"""
+    if profile == 'onefile':
+        return os.path.getsize(executable_path(profile))
+    total = 0
+    for root, _, files in os.walk(os.path.dirname(executable_path(profile))):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def runtime_modules():
+    """Top-level modules the chatbot imports while starting and answering a message"""
+    print("🔍 Analysing modules imported at runtime...")
+    env = dict(os.environ, TOGETHER_API_KEY=os.getenv('TOGETHER_API_KEY') or 'probe-key')
+    result = subprocess.run([sys.executable, '-c', RUNTIME_PROBE], capture_output=True,
+                            text=True, timeout=120, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"runtime analysis failed: {result.stderr.strip()[-500:]}")
+    modules = json.loads(result.stdout.strip().splitlines()[-1])
+    return {name.split('.')[0] for name in modules}
+
+def dependency_modules(root='together'):
+    """Top-level modules of `root` and every package it depends on"""
+    from importlib import metadata
+    modules_by_dist = {}
+    for module, dists in metadata.packages_distributions().items():
+        for dist in dists:
+            modules_by_dist.setdefault(dist.lower().replace('_', '-'), set()).add(module)
+    seen, pending = set(), [root]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        try:
+            requires = metadata.requires(name) or []
+        except metadata.PackageNotFoundError:
+            continue
+        for requirement in requires:
+            if 'extra ==' in requirement:
+                continue  # Optional extras are not installed by default
+            pending.append(re.split(r'[\s;<>=!~\[(]', requirement, 1)[0].lower().replace('_', '-'))
+    return {module for dist in seen for module in modules_by_dist.get(dist, ())}
+
+def trimmed_exclusions():
+    """Packages to leave out of the trimmed build: installed with the SDK but never imported"""
+    used = runtime_modules()
+    candidates = dependency_modules() | set(UNUSED_STDLIB)
+    excluded = sorted(m for m in candidates if m not in used and not m.startswith('_'))
+    print(f"✅ {len(used)} top-level modules used at runtime; excluding {len(excluded)}: "
+          f"{', '.join(excluded) or 'none'}")
+    return excluded
+
+def pyinstaller_command(profile, dist_file, excluded=()):
     cmd = [
         sys.executable, '-m', 'PyInstaller',
-        '--onefile',
+        '--onefile' if profile == 'onefile' else '--onedir',
         '--console',
-        '--name', 'AI_Chatbot',
-        '--distpath', 'dist',
+        '--name', APP_NAME,
+        '--distpath', dist_path(profile),
         '--clean',
         '--noconfirm',
-        dist_file
     ]
+    for module in excluded:
+        cmd += ['--exclude-module', module]
+    if profile == 'trimmed' and not sys.platform.startswith('win'):
+        cmd.append('--strip')  # Drop debug symbols from bundled shared libraries
+    return cmd + [dist_file]
+
+def drop_page_cache():
+    """Evict files from the OS cache for a true cold start (Linux, as root); True on success
+
+    This flushes the page cache of the whole host, so it only runs with --drop-caches.
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except OSError:
+        return False
+
+def time_to_prompt(exe, timeout=60):
+    """Seconds from launching the executable until it shows its first prompt"""
+    # No pre-warming: the measurement must not depend on the network
+    started = time.perf_counter()
+    process = subprocess.Popen([exe, '--no-prewarm'], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    prompted = threading.Event()
+    output = []
+    
+    def watch():
+        seen = b''
+        for chunk in iter(lambda: process.stdout.read1(4096), b''):
+            output.append(chunk)
+            seen = (seen + chunk)[-64:]
+            if b'You: ' in seen:
+                prompted.set()
+                return
+    
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        deadline = started + timeout
+        while not prompted.wait(0.05):
+            if process.poll() is not None:
+                # e.g. a trimmed build missing a module it needs
+                watcher.join(1)
+                text = b''.join(output).decode('utf-8', 'replace').strip()
+                raise RuntimeError(f"exited with code {process.returncode} before the prompt:\n"
+                                   f"{text[-1000:]}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"no prompt within {timeout}s")
+        return time.perf_counter() - started
+    finally:
+        try:
+            process.communicate(b'exit\n', timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def measure_startup(profile, runs=5, drop_caches=False):
+    """(cold, warm median, cold_is_real) time to prompt of a built profile"""
+    exe = executable_path(profile)
+    really_cold = drop_caches and drop_page_cache()
+    cold = time_to_prompt(exe)
+    warm = statistics.median(time_to_prompt(exe) for _ in range(runs))
+    return cold, warm, really_cold
+
+def build_profile(profile, dist_file, measure=True, runs=5, drop_caches=False):
+    """Build one profile; returns its report row, or None if the build failed"""
+    print(f"🔨 Building '{profile}' profile...")
+    excluded = trimmed_exclusions() if profile == 'trimmed' else ()
     
     print("⚡ Running PyInstaller...")
+    result = subprocess.run(pyinstaller_command(profile, dist_file, excluded),
+                            capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        print("❌ Build failed!")
+        print("Error:", result.stderr[-500:])
+        return
+    
+    exe_path = executable_path(profile)
+    if not os.path.exists(exe_path):
+        print(f"❌ Build finished but {exe_path} is missing")
+        return
+    print("✅ Build completed successfully!")
+    report = {'profile': profile, 'path': os.path.abspath(exe_path), 'size': build_size(profile)}
+    print(f"📦 Size: {report['size'] / (1024 * 1024):.1f} MB")
+    print(f"📁 Location: {report['path']}")
+    
+    if measure:
+        print(f"⏱️ Measuring time to prompt (1 cold + {runs} warm launches)...")
+        try:
+            report['cold'], report['warm'], report['really_cold'] = measure_startup(
+                profile, runs, drop_caches)
+            print(f"⏱️ Cold start {report['cold']:.2f}s, warm start {report['warm']:.2f}s")
+        except Exception as e:
+            print(f"⚠️ Could not measure start-up: {e}")
+    return report
+
+def print_comparison(reports):
+    """Size and start-up of every profile built"""
+    print()
+    print("📊 Build profiles:")
+    print(f"   {'profile':<9} {'size':>9} {'cold start':>11} {'warm start':>11}")
+    for report in reports:
+        cold = f"{report['cold']:.2f}s" if 'cold' in report else '-'
+        warm = f"{report['warm']:.2f}s" if 'warm' in report else '-'
+        print(f"   {report['profile']:<9} {report['size'] / (1024 * 1024):>7.1f}MB "
+              f"{cold:>11} {warm:>11}")
+    if any('cold' in r and not r['really_cold'] for r in reports):
+        print("   Cold start = first launch after the build; on Linux, --drop-caches (as root) "
+              "clears the file cache first")
+
+def build_executable(profiles=('onefile',), measure=True, runs=5, drop_caches=False):
+    """Build the standalone executable in each requested profile"""
+    api_key = load_api_key()
+    if not api_key:
+        return False
+    
+    dist_file = prepare_distribution_file(api_key)
+    reports = []
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        for profile in profiles:
+            try:
+                report = build_profile(profile, dist_file, measure, runs, drop_caches)
+            except subprocess.TimeoutExpired:
+                print("❌ Build timed out!")
+                report = None
+            except Exception as e:
+                print(f"❌ Build error: {e}")
+                report = None
+            if report is None:
+                return False
+            reports.append(report)
+    finally:
+        # Clean up
+        for cleanup in [dist_file, f'{APP_NAME}.spec']:
+            if os.path.exists(cleanup):
+                os.remove(cleanup)
+                print(f"🧹 Cleaned up: {cleanup}")
         
-        if result.returncode == 0:
-            print("✅ Build completed successfully!")
-            
-            # Check file
-            exe_path = os.path.join('dist', 'AI_Chatbot.exe')
-            if os.path.exists(exe_path):
-                size_mb = os.path.getsize(exe_path) / (1024 * 1024)
-                print(f"📦 Executable size: {size_mb:.1f} MB")
-                print(f"📁 Location: {os.path.abspath(exe_path)}")
-            
-            # Clean up
-            for cleanup in [dist_file, 'AI_Chatbot.spec']:
-                if os.path.exists(cleanup):
-                    os.remove(cleanup)
-                    print(f"🧹 Cleaned up: {cleanup}")
-            
-            if os.path.exists('build'):
-                shutil.rmtree('build')
-                print("🧹 Cleaned up build directory")
-            
-            print()
-            print("🎉 SUCCESS! Your executable is ready for distribution!")
-            print("📦 The executable includes:")
-            print("   ✅ Embedded API key (no setup needed)")
-            print("   ✅ All dependencies included")
-            print("   ✅ Unicode/emoji support with fallback")
-            print("   ✅ Works on all Windows systems")
-            return True
-        else:
-            print("❌ Build failed!")
-            print("Error:", result.stderr[:500])
-            return False
-            
-    except subprocess.TimeoutExpired:
-        print("❌ Build timed out!")
-        return False
-    except Exception as e:
-        print(f"❌ Build error: {e}")
-        return False
+        if os.path.exists('build'):
+            shutil.rmtree('build')
+            print("🧹 Cleaned up build directory")
+    
+    print_comparison(reports)
+    print()
+    print("🎉 SUCCESS! Your executable is ready for distribution!")
+    print("📦 The executable includes:")
+    print("   ✅ Embedded API key (no setup needed)")
+    print("   ✅ All dependencies the chatbot uses")
+    print("   ✅ Unicode/emoji support with fallback")
+    print("   ✅ Works on Windows and Linux")
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the AI Chatbot executable")
+    parser.add_argument("--profile", choices=PROFILES + ['all'], default='onefile',
+                        help="onefile (default): single file, unpacks on every launch; "
+                             "onedir: folder, fastest start; trimmed: onedir without packages "
+                             "unused at runtime; all: build and compare every profile")
+    parser.add_argument("--runs", type=int, default=5, metavar="N",
+                        help="warm launches timed per build (default: 5)")
+    parser.add_argument("--no-measure", action="store_true",
+                        help="skip the start-up time measurement")
+    parser.add_argument("--drop-caches", action="store_true",
+                        help="Linux, as root: flush the host's whole page cache before the "
+                             "cold launch so it reads everything from disk")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args()
     print("🚀 AI Chatbot Build Script")
     print("=" * 30)
     
@@ -141,7 +370,9 @@ if __name__ == "__main__":
         print("❌ Together library not found. Installing...")
         subprocess.run([sys.executable, '-m', 'pip', 'install', 'together'])
     
-    success = build_executable()
+    success = build_executable(PROFILES if args.profile == 'all' else [args.profile],
+                               measure=not args.no_measure, runs=max(1, args.runs),
+                               drop_caches=args.drop_caches)
     
     if success:
         print("\n🎯 Next steps:")
@@ -1,12 +1,883 @@
-from together import Together
 import time
+_IMPORT_STARTED = time.perf_counter()
 import os
 import sys
-import subprocess
-import locale
+import json
+import codecs
+import io
+import queue
+import threading
+from collections import deque
+
+# The Together SDK is imported on first use (see create_client): it is the
+# slowest import by far and is not needed to show the prompt
+from coalesce import SingleFlight
+from connection import DEFAULT_BASE_URL, ConnectionWarmer, create_http_client
+from metrics import MetricsRegistry, RequestTimer
+from near_cache import NearDuplicateCache
+from rate_limit import (EXPECTED_COMPLETION_TOKENS, PRIORITY_INTERACTIVE, PRIORITY_RESUME,
+                        RateLimiter, default_shared_path)
+from resilience import CircuitBreakers, RetryPolicy, is_retryable, iter_with_timeouts, status_code
+from response_cache import ResponseCache, make_key
+from router import ModelRouter
+
+def process_start_time(pid):
+    """Wall-clock time a process was created, or None where this is not supported"""
+    try:
+        if sys.platform.startswith('win'):
+            import ctypes
+            from ctypes import wintypes
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle:
+                return
+            times = [wintypes.FILETIME() for _ in range(4)]
+            ok = kernel32.GetProcessTimes(handle, *[ctypes.byref(t) for t in times])
+            kernel32.CloseHandle(handle)
+            if not ok:
+                return
+            ticks = (times[0].dwHighDateTime << 32) | times[0].dwLowDateTime
+            return ticks / 1e7 - 11644473600  # FILETIME counts 100ns from 1601
+        with open(f"/proc/{pid}/stat", encoding="ascii") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", encoding="ascii") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return
+
+class StartupProfiler:
+    """Wall-clock breakdown of the work done before the first prompt (--profile-startup)"""
+
+    def __init__(self, started):
+        self.started = started
+        self.phases = []  # [name, seconds, depth], in start order
+        self._depth = 0
+
+    def add(self, name, seconds):
+        self.phases.append([name, seconds, self._depth])
+
+    def measure(self, name, func, *args, **kwargs):
+        """Call func and record how long it took (phases it starts are nested under it)"""
+        phase = [name, 0.0, self._depth]
+        self.phases.append(phase)
+        self._depth += 1
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            phase[1] = time.perf_counter() - started
+            self._depth -= 1
+
+    def report(self):
+        total = time.perf_counter() - self.started
+        safe_print("[PROFILE] Startup breakdown:")
+        # A onefile executable unpacks itself in a parent bootloader process
+        frozen = getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS')
+        created = process_start_time(os.getppid() if frozen else os.getpid())
+        if created is not None:
+            before = max(0.0, time.time() - total - created)
+            label = "unpack + interpreter" if frozen else "interpreter start"
+            safe_print(f"   {label:<24}{before * 1000:8.1f} ms")
+        for name, seconds, depth in self.phases:
+            label = "  " * depth + name
+            safe_print(f"   {label:<24}{seconds * 1000:8.1f} ms")
+        safe_print(f"   {'time to prompt':<24}{total * 1000:8.1f} ms (from first import)")
+
+startup_profile = StartupProfiler(_IMPORT_STARTED)
+startup_profile.add("import modules", time.perf_counter() - _IMPORT_STARTED)
+
+class Spinner:
+    """Non-blocking "Thinking..." indicator drawn on a background thread"""
+
+    def __init__(self, text="Thinking", interval=0.1):
+        self.text = text
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._width = len(text) + 3
+
+    def start(self):
+        """Start animating without blocking the caller"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        dots = 0
+        while not self._stop_event.is_set():
+            frame = (self.text + "." * dots).ljust(self._width)
+            print("\r" + frame, end="", flush=True)
+            dots = (dots + 1) % 4
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        """Stop the animation and clear it from the current line"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        print("\r" + " " * self._width + "\r", end="", flush=True)
+
+class InputReader:
+    """Reads input lines on a background thread, so the next prompt can be typed
+    while a response is still streaming"""
+
+    def __init__(self, on_line=None, stream=None):
+        # on_line(line) runs on the reader thread; returning True consumes the line
+        self.on_line = on_line
+        self.stream = stream or sys.stdin
+        self.lines = queue.Queue()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                line = self.stream.readline()
+            except (OSError, ValueError):
+                line = ""
+            if not line:
+                self.lines.put(None)  # End of input
+                return
+            line = line.rstrip("\r\n")
+            if self.on_line is not None and self.on_line(line):
+                continue
+            self.lines.put(line)
+
+    def read(self, prompt):
+        """(line, typed_ahead): the next line, printing prompt only if none is queued"""
+        try:
+            line = self.lines.get_nowait()
+            typed_ahead = True
+        except queue.Empty:
+            print(prompt, end="", flush=True)
+            typed_ahead = False
+            while True:
+                try:
+                    # Short waits keep Ctrl+C responsive on the main thread
+                    line = self.lines.get(timeout=0.25)
+                    break
+                except queue.Empty:
+                    continue
+        if line is None:
+            self.lines.put(None)  # Stay at end of input for later reads
+            raise EOFError
+        return line, typed_ahead
+
+class RawRenderer:
+    """Write each streamed delta with a single buffered write"""
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+        self._cancelled = False
+
+    def start(self):
+        """Prepare for a new response"""
+        self._cancelled = False
+
+    def feed(self, text):
+        """Render one streamed delta"""
+        self._write(text)
+        self.stream.flush()
+
+    def flush(self):
+        """Write out anything still pending immediately"""
+        self.stream.flush()
+
+    def finish(self):
+        """Complete the current response"""
+        self.flush()
+
+    def cancel(self):
+        """Abandon the current response, dropping anything not yet shown"""
+        self.stream.flush()
+
+    def request_cancel(self):
+        """Ask, from any thread, for the response to stop being shown
+
+        Only sets a flag: the thread that renders stops at its next step and
+        calls cancel() itself, so pending text is never touched from two threads.
+        """
+        self._cancelled = True
+
+    def _write(self, text):
+        self.stream.write(to_console(text))
+
+class TypingRenderer(RawRenderer):
+    """Typing effect paced by a wall-clock budget instead of per-character sleeps"""
+
+    def __init__(self, chars_per_second=120, max_lag=1.0, max_drain=1.5,
+                 frame_interval=1 / 30, stream=None):
+        super().__init__(stream)
+        self.chars_per_second = chars_per_second
+        self.max_lag = max_lag            # Seconds the display may trail the stream
+        self.max_drain = max_drain        # Seconds allowed to finish once the stream ends
+        self.frame_interval = frame_interval
+        self.start()
+
+    def start(self):
+        self._pending = ""
+        self._emitted = 0
+        self._clock = None
+        self._cancelled = False
+
+    def feed(self, text):
+        if self._clock is None:
+            self._clock = time.perf_counter()
+        self._pending += text
+        self._emit_due(self.chars_per_second)
+
+    def _emit_due(self, rate):
+        """Write every character the time budget allows, in one write"""
+        allowed = int((time.perf_counter() - self._clock) * rate) - self._emitted
+        # Catch up when the display falls too far behind the stream
+        backlog = len(self._pending) - int(self.chars_per_second * self.max_lag)
+        count = min(max(allowed, backlog), len(self._pending))
+        if count > 0:
+            self._write(self._pending[:count])
+            self.stream.flush()
+            self._pending = self._pending[count:]
+            self._emitted += count
+
+    def flush(self):
+        if self._pending and not self._cancelled:
+            self._write(self._pending)
+            self._pending = ""
+        self.stream.flush()
+
+    def finish(self):
+        if self._pending:
+            # Speed up so the tail never takes longer than max_drain
+            rate = max(self.chars_per_second, len(self._pending) / self.max_drain)
+            self._clock = time.perf_counter()
+            self._emitted = 0
+            while self._pending and not self._cancelled:
+                time.sleep(self.frame_interval)
+                self._emit_due(rate)
+        self.flush()
+
+    def cancel(self):
+        self._cancelled = True
+        self._pending = ""
+        self.stream.flush()
+
+# ANSI escape sequences used by MarkdownRenderer
+RESET = "\033[0m"
+BOLD = "\033[1m"
+DIM = "\033[2m"
+HEADING_STYLE = "\033[1;36m"  # Bold cyan
+CODE_STYLE = "\033[33m"       # Yellow
+MARKER_STYLE = "\033[36m"     # Cyan list bullets and numbers
+
+class MarkdownRenderer(RawRenderer):
+    """Streams Markdown as styled text: headings, lists, quotes, code fences, **bold** and `code`
+
+    A resumable state machine looks at each character once. Only the few
+    characters that decide what a line is (such as "## " or "```") are held
+    back, so nothing is re-scanned and the work stays linear in the length of
+    the response. Consoles without ANSI support get the text unchanged.
+    """
+
+    def __init__(self, stream=None, styles=None):
+        super().__init__(stream)
+        self.styles = styles  # None: detected with the first response
+        self.start()
+
+    def start(self):
+        if self.styles is None:
+            self.styles = enable_ansi_styles()
+        self._line_start = True
+        self._prefix = ""        # Held-back start of the current line
+        self._in_fence = False
+        self._line_style = ""    # Style of the whole current line
+        self._bold = False
+        self._code = False
+        self._star = False       # A "*" that may be the first half of "**"
+
+    def feed(self, text):
+        if not self.styles:
+            return super().feed(text)
+        out = []
+        for char in text:
+            if char == "\n":
+                if self._line_start:
+                    self._decide(out, final=True)
+                self._end_line(out)
+            elif self._line_start:
+                self._prefix += char
+                self._decide(out)
+            else:
+                self._inline(out, char)
+        if out:
+            self._write("".join(out))
+        self.stream.flush()
+
+    def finish(self):
+        if self.styles:
+            out = []
+            if self._line_start and self._prefix:
+                self._decide(out, final=True)
+            self._close_line(out)
+            self._write("".join(out))
+        self.flush()
+
+    def cancel(self):
+        if self.styles and (self._line_style or self._bold or self._code):
+            self._write(RESET)
+        self._prefix = ""
+        self.stream.flush()
+
+    def _decide(self, out, final=False):
+        """Classify the line once its prefix is conclusive; until then keep holding it"""
+        prefix = self._prefix
+        body = prefix.lstrip(" ")
+        indent = prefix[:len(prefix) - len(body)]
+        # Past a dozen characters no marker is still possible
+        final = final or len(prefix) > 12
+        if not body and not final:
+            return
+        if "```".startswith(body) and body and not final:
+            return  # Maybe a fence
+        if body.startswith("```"):
+            # Fence lines are shown dimmed; the language tag streams on after them
+            self._in_fence = not self._in_fence
+            self._begin_line(out, DIM, prefix)
+            return
+        if self._in_fence:
+            self._begin_line(out, CODE_STYLE, prefix)
+            return
+        marker = body.split(" ", 1)[0]
+        complete = " " in body
+        if marker and set(marker) == {"#"} and len(marker) <= 6:
+            if not complete and not final:
+                return
+            if complete:
+                self._begin_line(out, HEADING_STYLE, indent, body[len(marker) + 1:])
+                return
+        elif marker in ("-", "*", "+"):
+            if not complete and not final:
+                return
+            if complete:
+                self._begin_line(out, "", indent + MARKER_STYLE + "\u2022" + RESET + " ",
+                                 body[len(marker) + 1:])
+                return
+        elif marker[:-1].isdigit() and marker.endswith(".") and len(marker) <= 4:
+            if not complete and not final:
+                return
+            if complete:
+                self._begin_line(out, "", indent + MARKER_STYLE + marker + RESET + " ",
+                                 body[len(marker) + 1:])
+                return
+        elif marker.isdigit() and len(marker) <= 3 and not complete and not final:
+            return  # Maybe a numbered item
+        elif body.startswith(">"):
+            self._begin_line(out, DIM, indent + body[0], body[1:])
+            return
+        self._begin_line(out, "", indent, body)
+
+    def _begin_line(self, out, style, lead, rest=""):
+        """Emit the decided start of a line; the rest goes through inline styling"""
+        self._line_start = False
+        self._prefix = ""
+        self._line_style = style
+        out.append(style + lead)
+        for char in rest:
+            self._inline(out, char)
+
+    def _inline(self, out, char):
+        if self._in_fence:
+            out.append(char)
+            return
+        if self._star:
+            self._star = False
+            if char == "*":
+                self._bold = not self._bold
+                out.append(BOLD if self._bold else self._restore())
+                return
+            out.append("*")
+        if char == "*" and not self._code:
+            self._star = True
+        elif char == "`":
+            self._code = not self._code
+            out.append(CODE_STYLE if self._code else self._restore())
+        else:
+            out.append(char)
+
+    def _restore(self):
+        """Escape sequence that returns to the styles still in effect"""
+        return (RESET + self._line_style + (BOLD if self._bold else "")
+                + (CODE_STYLE if self._code else ""))
+
+    def _close_line(self, out):
+        if self._star:
+            out.append("*")
+        if self._line_style or self._bold or self._code:
+            out.append(RESET)
+        # Unclosed ** or ` never bleed into the next line
+        self._line_style = ""
+        self._bold = self._code = self._star = False
+
+    def _end_line(self, out):
+        self._close_line(out)
+        out.append("\n")
+        self._line_start = True
+        self._prefix = ""
+
+# Available output modes, selectable with --render or Chatbot(render_mode=...)
+RENDERERS = {
+    "raw": RawRenderer,
+    "typing": TypingRenderer,
+    "markdown": MarkdownRenderer,
+}
+
+def create_renderer(mode):
+    """Build a renderer from a mode name, or pass a renderer instance through"""
+    if not isinstance(mode, str):
+        return mode
+    try:
+        return RENDERERS[mode]()
+    except KeyError:
+        raise ValueError(f"Unknown render mode '{mode}' (choose from: {', '.join(RENDERERS)})")
+
+# Supported models by short name
+MODELS = {
+    "3b": "meta-llama/Llama-3.2-3B-Instruct-Turbo",
+    "11b": "meta-llama/Llama-3.2-11B-Vision-Instruct-Turbo",
+    "70b": "meta-llama/Llama-3.3-70B-Instruct-Turbo",
+}
+
+# Prompt token budget per model; older turns are trimmed to stay inside it so
+# request size (and with it latency and cost) stays bounded in long sessions
+CONTEXT_TOKEN_BUDGETS = {
+    MODELS["3b"]: 4096,
+    MODELS["11b"]: 6144,
+    MODELS["70b"]: 8192,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 4096
+
+# Models to fail over to, in order, when the requested one keeps failing
+FAILOVER_ORDER = [MODELS["3b"], MODELS["11b"], MODELS["70b"]]
+
+def model_name(model):
+    """Short name of a model id (the id itself if it has none)"""
+    for name, model_id in MODELS.items():
+        if model_id == model:
+            return name
+    return model
+
+def estimate_tokens(text):
+    """Cheap token estimate: ~4 characters per token plus per-message overhead"""
+    return len(text) // 4 + 4
+
+# One shared copy of each role string, however many messages use it
+ROLES = {role: sys.intern(role) for role in ("system", "user", "assistant")}
+
+class Message:
+    """One conversation message with its token estimate (slots: no per-message dict)"""
+
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role, content, tokens=None):
+        self.role = ROLES.get(role) or sys.intern(role)
+        self.content = content
+        self.tokens = estimate_tokens(content) if tokens is None else tokens
+
+    @property
+    def size(self):
+        """Bytes held by this message and its text"""
+        return sys.getsizeof(self) + sys.getsizeof(self.content)
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
+
+class DeltaBuffer:
+    """Streamed deltas written into one growing buffer instead of a list of small strings"""
 
-class Chatbot:
     def __init__(self):
+        self._buffer = io.StringIO()
+        self.chars = 0
+
+    def append(self, delta):
+        self._buffer.write(delta)
+        self.chars += len(delta)
+
+    def __len__(self):
+        return self.chars
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+class ConversationHistory:
+    """Conversation turns with token counts and memory use tracked as messages are appended"""
+
+    def __init__(self, system_prompt=None):
+        self.system_message = None
+        self.system_tokens = 0
+        if system_prompt:
+            self.system_message = {"role": "system", "content": system_prompt}
+            self.system_tokens = estimate_tokens(system_prompt)
+        self._turns = deque()  # Messages, oldest first
+        self.total_tokens = self.system_tokens
+        self.memory_bytes = sys.getsizeof(system_prompt) if system_prompt else 0
+
+    def __len__(self):
+        return len(self._turns)
+
+    def append(self, role, content):
+        """Add a message, counting its tokens and size once"""
+        message = Message(role, content)
+        self._turns.append(message)
+        self.total_tokens += message.tokens
+        self.memory_bytes += message.size
+
+    def _forget(self, message):
+        self.total_tokens -= message.tokens
+        self.memory_bytes -= message.size
+
+    def pop(self):
+        """Remove and return the newest message"""
+        message = self._turns.pop()
+        self._forget(message)
+        return message.to_dict()
+
+    def trim(self, budget):
+        """Drop the oldest turns until the history fits in the token budget"""
+        dropped = 0
+        # Always keep the newest message, even if it alone exceeds the budget
+        while self.total_tokens > budget and len(self._turns) > 1:
+            self._forget(self._turns.popleft())
+            dropped += 1
+        # Never start the context with an orphaned assistant reply
+        while len(self._turns) > 1 and self._turns[0].role == "assistant":
+            self._forget(self._turns.popleft())
+            dropped += 1
+        return dropped
+
+    def clear(self):
+        """Forget all turns (the system prompt is kept)"""
+        for message in self._turns:
+            self.memory_bytes -= message.size
+        self._turns.clear()
+        self.total_tokens = self.system_tokens
+
+    def messages(self):
+        """Messages in API request format"""
+        messages = [message.to_dict() for message in self._turns]
+        if self.system_message:
+            messages.insert(0, self.system_message)
+        return messages
+
+def chunk_content(chunk):
+    """Text delta carried by a streamed completion chunk (empty if none)"""
+    if (chunk.choices and
+        len(chunk.choices) > 0 and
+        chunk.choices[0].delta and
+        chunk.choices[0].delta.content):
+        return chunk.choices[0].delta.content
+    return ""
+
+class ResponseCancelled(Exception):
+    """The response was cancelled while streaming (see CompletionStream.cancel)"""
+
+class CompletionStream:
+    """Content deltas of one streaming completion, with timing and token usage"""
+
+    cached = False
+    coalesced = False
+    similarity = None  # Answers reused from a similar prompt carry the match score
+
+    def __init__(self, client, model, messages, params=None, on_complete=None, metrics=None,
+                 retry_policy=None, breakers=None, failover=None,
+                 first_token_timeout=None, chunk_timeout=None, limiter=None,
+                 priority=PRIORITY_INTERACTIVE):
+        self.client = client
+        self.model = model
+        self.messages = messages
+        self.params = params or {}
+        self.on_complete = on_complete
+        self.metrics = metrics
+        # Resilience: retries with backoff, per-model circuit breakers, and the
+        # ordered list of models to fail over to (the requested model first)
+        self.retry_policy = retry_policy
+        self.breakers = breakers
+        self.failover = failover or [model]
+        self.first_token_timeout = first_token_timeout
+        self.chunk_timeout = chunk_timeout
+        self.retries = 0
+        # Client-side rate limiting: every attempt reserves a request and its tokens
+        self.limiter = limiter
+        self.priority = priority
+        self.reserved_tokens = 0
+        # Set by callers that add render time after the stream ends, then call record()
+        self.defer_record = False
+        self.timer = RequestTimer(model, cached=self.cached, coalesced=self.coalesced)
+        self.started = None
+        self.ttft = None
+        self.latency = None
+        self.chunks = 0
+        self.chars = 0
+        self.usage = None
+        self._attempt = {"stream": None}
+        self._recorded = False
+        self.cancelled = False
+
+    def __iter__(self):
+        self.timer = RequestTimer(self.model, cached=self.cached, coalesced=self.coalesced)
+        self.started = self.timer.started
+        parts = DeltaBuffer()
+        error = None
+        try:
+            for content in self._deltas():
+                if self.cancelled:
+                    raise ResponseCancelled()
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - self.started
+                self.timer.chunk()
+                self.chunks += 1
+                self.chars += len(content)
+                if self.on_complete is not None:
+                    parts.append(content)
+                self.timer.handed_off()
+                yield content
+                self.timer.resumed()
+            if self.cancelled:
+                raise ResponseCancelled()
+            # Only fully received responses are handed on (e.g. to the cache),
+            # with the model that answered: it differs after a failover
+            if self.on_complete is not None and parts:
+                self.on_complete(parts.getvalue(), self.model)
+        except BaseException as e:
+            # Includes cancellation (KeyboardInterrupt, generator close)
+            error = type(e).__name__
+            raise
+        finally:
+            self.latency = time.perf_counter() - self.started
+            self.close()
+            self._settle()
+            self.timer.retries = self.retries
+            self.timer.finish(self.completion_tokens(), error)
+            if not self.defer_record:
+                self.record()
+
+    def _deltas(self):
+        """Content deltas, retrying, resuming and failing over as needed"""
+        received = []
+        failures = 0
+        model_failures = 0
+        index = 0
+        while True:
+            index = self._next_model(index)
+            model = self.failover[index]
+            if model != self.model:
+                self.model = self.timer.model = model
+            breaker = self.breakers[model] if self.breakers is not None else None
+            
+            messages = self.messages
+            if received:
+                # Resume a stream that died mid-way: the model continues its partial answer
+                messages = self.messages + [{"role": "assistant", "content": "".join(received)}]
+            # Wait for the rate limiter outside the stall timeouts below
+            self._acquire(messages, resuming=bool(received))
+            recorded = False
+            try:
+                for content in iter_with_timeouts(self._upstream(model, messages),
+                                                  self.first_token_timeout, self.chunk_timeout,
+                                                  on_timeout=self.close):
+                    received.append(content)
+                    yield content
+            except Exception as e:
+                self.close()
+                if self.cancelled:
+                    # Closing the stream from cancel() is not a provider failure
+                    raise ResponseCancelled() from e
+                retryable = is_retryable(e)
+                if breaker is not None and retryable:
+                    # Only outages count against the model; a 4xx is the request's
+                    # fault (and its trial slot is released below)
+                    breaker.record_failure()
+                    recorded = True
+                failures += 1
+                model_failures += 1
+                if (self.retry_policy is None or failures >= self.retry_policy.max_attempts
+                        or not retryable):
+                    raise
+                # Give each model a second chance before failing over to the next one
+                if model_failures >= 2 or (breaker is not None and breaker.state != "closed"):
+                    index = (index + 1) % len(self.failover)
+                    model_failures = 0
+                self.retries += 1
+                time.sleep(self.retry_policy.delay(failures - 1, e))
+                if self.cancelled:
+                    raise ResponseCancelled() from e
+                continue
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                    recorded = True
+            finally:
+                # Cancelled, interrupted or closed by the consumer: a half-open
+                # trial that learned nothing must not block the model for good
+                if breaker is not None and not recorded:
+                    breaker.release()
+            return
+
+    def _next_model(self, index):
+        """Index of the first model from `index` on whose circuit lets a request through"""
+        if self.breakers is None:
+            return index
+        for offset in range(len(self.failover)):
+            candidate = (index + offset) % len(self.failover)
+            if self.breakers[self.failover[candidate]].allow():
+                return candidate
+        raise RuntimeError("All models are temporarily unavailable (circuit open); try again shortly")
+
+    def _acquire(self, messages, resuming=False):
+        if self.limiter is None:
+            return
+        tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        tokens += self.params.get("max_tokens") or EXPECTED_COMPLETION_TOKENS
+        self.reserved_tokens += tokens
+        waited = self.limiter.acquire(tokens, PRIORITY_RESUME if resuming else self.priority)
+        self.timer.queued(waited)
+
+    def _settle(self):
+        """Give back (or pay for) the difference between reserved and used tokens"""
+        if self.limiter is None or not self.reserved_tokens:
+            return
+        prompt_tokens, completion_tokens, _ = self.token_counts()
+        if not completion_tokens:
+            completion_tokens = self.completion_tokens()
+        self.limiter.settle(self.reserved_tokens, prompt_tokens + completion_tokens)
+        self.reserved_tokens = 0
+
+    def _upstream(self, model, messages):
+        # Each attempt gets its own slot, so a timed-out attempt that is still
+        # running on the reader thread can never clobber the current stream
+        attempt = {"stream": None}
+        self._attempt = attempt
+        attempt["stream"] = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            **self.params
+        )
+        self.timer.sent()
+        for chunk in attempt["stream"]:
+            if attempt is not self._attempt or self.cancelled:
+                return
+            if getattr(chunk, "usage", None):
+                self.usage = chunk.usage
+            content = chunk_content(chunk)
+            if content:
+                yield content
+
+    def record(self):
+        """Report this request to the metrics registry (once)"""
+        if self.metrics is not None and not self._recorded and self.timer.total_seconds is not None:
+            self._recorded = True
+            self.metrics.record(self.timer)
+
+    def cancel(self):
+        """Stop the response from any thread, closing the HTTP stream right away"""
+        self.cancelled = True
+        self.close()
+
+    def close(self):
+        """Release the underlying HTTP stream"""
+        close = getattr(self._attempt["stream"], "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                # The stream may be mid-read on the timeout reader thread
+                pass
+
+    def completion_tokens(self):
+        """Completion tokens from the API usage block, or estimated from the text"""
+        if self.usage is not None:
+            return getattr(self.usage, "completion_tokens", 0) or 0
+        return self.chars // 4
+
+    def token_counts(self, text=""):
+        """(prompt_tokens, completion_tokens, estimated) from usage, or estimates if absent"""
+        if self.usage is not None:
+            return (getattr(self.usage, "prompt_tokens", 0) or 0,
+                    getattr(self.usage, "completion_tokens", 0) or 0,
+                    False)
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in self.messages)
+        return prompt_tokens, estimate_tokens(text) if text else 0, True
+
+class CachedCompletion(CompletionStream):
+    """A cached response replayed as stream deltas, so it renders like a live one"""
+
+    cached = True
+    replay_chunk_size = 32
+
+    def __init__(self, model, messages, text, metrics=None, similarity=None):
+        super().__init__(None, model, messages, metrics=metrics)
+        self.text = text
+        # Set when the answer was given to a similar, not identical, prompt
+        self.similarity = similarity
+
+    def _deltas(self):
+        self.timer.sent()
+        for start in range(0, len(self.text), self.replay_chunk_size):
+            yield self.text[start:start + self.replay_chunk_size]
+
+class CoalescedCompletion(CompletionStream):
+    """A subscriber to a stream shared by identical concurrent requests (see coalesce.py)"""
+
+    def __init__(self, flight, model, messages, leader, metrics=None):
+        # Only requests that rode along on another request's stream count as coalesced
+        self.coalesced = not leader
+        super().__init__(None, model, messages, metrics=metrics)
+        self.flight = flight
+        self.leader = leader
+
+    def _deltas(self):
+        self.timer.sent()
+        try:
+            yield from self.flight.subscribe(stop=lambda: self.cancelled)
+        finally:
+            # The last subscriber to leave cancels the shared upstream stream
+            self.flight.leave()
+        upstream = self.flight.upstream
+        self.model = self.timer.model = upstream.model
+        self.usage = upstream.usage
+        if self.leader:
+            self.retries = upstream.retries
+            self.timer.queued(upstream.timer.queue_seconds)
+
+def create_client(api_key, base_url=None):
+    """Import the Together SDK and build a client; returns (client, pooled http client)
+
+    The http client is None when the SDK cannot take one (older versions).
+    """
+    started = time.perf_counter()
+    from together import Together
+    startup_profile.add("import together", time.perf_counter() - started)
+    options = {"api_key": api_key}
+    if base_url:
+        options["base_url"] = base_url
+    http_client = create_http_client()
+    if http_client is not None:
+        try:
+            return Together(http_client=http_client, **options), http_client
+        except TypeError:
+            http_client.close()
+    return Together(**options), None
+
+class Chatbot:
+    def __init__(self, show_timing=True, render_mode="typing", context_budget=None,
+                 system_prompt=None, cache=None, metrics=None, base_url=None,
+                 retry_policy=None, failover=True, first_token_timeout=60.0,
+                 chunk_timeout=30.0, limiter=None, priority=PRIORITY_INTERACTIVE,
+                 coalesce=True, lazy_client=False, prewarm=False, store=None, router=None,
+                 near_cache=None):
         # API Key Configuration
         # For development: Load from environment or .env file
         # For distribution: Will be replaced with embedded key during build
@@ -20,24 +891,120 @@ class Chatbot:
             print()
             sys.exit(1)
         
-        try:
-            self.client = Together(api_key=api_key)
-            # Note: Skipping model list test to avoid validation errors
-            safe_print("[OK] Connected to Together.ai successfully!")
-        except Exception as e:
-            safe_print(f"[ERROR] Failed to initialize Together.ai client")
-            print(f"   Details: {e}")
-            print("   Please check your API key and internet connection.")
-            sys.exit(1)
+        # base_url points the client at a compatible endpoint (e.g. the benchmark mock)
+        self.api_key = api_key
+        self.base_url = base_url or os.getenv('TOGETHER_BASE_URL')
+        self._client = None
+        self.http_client = None
+        self._client_lock = threading.Lock()
+        if lazy_client:
+            # Fast start: the SDK is imported and the client built with the first request
+            safe_print("[OK] Ready! Connecting to Together.ai with your first message.")
+        else:
+            try:
+                self._client, self.http_client = create_client(api_key, self.base_url)
+                # Note: Skipping model list test to avoid validation errors
+                safe_print("[OK] Connected to Together.ai successfully!")
+            except Exception as e:
+                safe_print(f"[ERROR] Failed to initialize Together.ai client")
+                print(f"   Details: {e}")
+                print("   Please check your API key and internet connection.")
+                sys.exit(1)
         
         # Model configuration
         # Using the most stable and reliable model
-        self.model = "meta-llama/Llama-3.2-3B-Instruct-Turbo"
-        # Alternative models (uncomment to try):
-        # self.model = "meta-llama/Llama-3.2-11B-Vision-Instruct-Turbo"  # Larger model
-        # self.model = "meta-llama/Llama-3.3-70B-Instruct-Turbo"        # Largest (may require special access)
+        self.model = MODELS["3b"]
+        # Alternative models (see MODELS):
+        # self.model = MODELS["11b"]  # Larger model
+        # self.model = MODELS["70b"]  # Largest (may require special access)
+        
+        # Conversation memory, trimmed to a per-model token budget before each request
+        self.history = ConversationHistory(system_prompt)
+        self.context_budget_override = context_budget
+        
+        # Optional ResponseCache consulted before calling the API, then an optional
+        # NearDuplicateCache for prompts that differ only slightly from earlier ones
+        self.cache = cache
+        self.near_cache = near_cache
+        self.last_near_hit = None
+        
+        # Per-request latency/throughput metrics (see /stats)
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        
+        # Optional ModelRouter picking the model per turn (see /model); it learns
+        # each model's latency from the metrics of every finished request
+        self.router = router
+        self.route_reason = None
+        if router is not None:
+            self.metrics.add_listener(router.observe_timer)
+        
+        # Transient failures (429/5xx, timeouts, dropped streams) are retried with
+        # backoff and may fail over to other models; broken models are skipped
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.failover = failover
+        self.breakers = CircuitBreakers()
+        self.first_token_timeout = first_token_timeout
+        self.chunk_timeout = chunk_timeout
+        
+        # Optional client-side rate limiter shared by every request (and, with a
+        # shared state file, by every chatbot process using the same API key)
+        self.limiter = limiter
+        self.priority = priority
+        
+        # Optional persistent conversation store (see session_store.py)
+        self.store = store
+        self.session_id = None
+        
+        # Identical concurrent requests share one upstream stream
+        self.flights = SingleFlight() if coalesce else None
+        
+        # Output renderer: a mode name from RENDERERS or a renderer instance
+        self.renderer = create_renderer(render_mode)
+        
+        # Open the provider connection while the user reads the tips and types,
+        # and keep it alive between turns
+        self.warmer = None
+        self._warmup_reported = False
+        if prewarm:
+            self.warmer = ConnectionWarmer(self._warm_target).start()
+        
+        # Report time-to-first-token after each response
+        self.show_timing = show_timing
+        self.last_ttft = None
+        
+        # The response being streamed, so it can be cancelled from the input thread
+        self.active_stream = None
+
+    @property
+    def client(self):
+        """The Together client, created on first use in fast-start mode"""
+        if self._client is None:
+            # The connection warmer may be creating it at the same time
+            with self._client_lock:
+                if self._client is None:
+                    self._client, self.http_client = create_client(self.api_key, self.base_url)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def _warm_target(self):
+        """(http client, base URL) for the connection warmer; creates the client if needed"""
+        client = self.client
+        return self.http_client, str(getattr(client, "base_url", "") or self.base_url or DEFAULT_BASE_URL)
+
+    def report_warmup(self):
+        """Print the warm-up outcome once it is known (once per session)"""
+        if self.warmer is None or self._warmup_reported:
+            return
+        summary = self.warmer.summary()
+        if summary is not None:
+            self._warmup_reported = True
+            safe_print(summary)
 
-    def load_api_key(self):
+    @staticmethod
+    def load_api_key():
         """Load API key from environment variable or .env file"""
         # First try environment variable
         api_key = os.getenv('TOGETHER_API_KEY')
@@ -66,71 +1033,208 @@ class Chatbot:
     def enter_prompt(self, message):
         self.display_response(message)
 
+    def cancel(self):
+        """Cancel the response being streamed, if any; returns True if there was one"""
+        stream = self.active_stream
+        if stream is None:
+            return False
+        stream.cancel()
+        # Also stops the typing effect draining what was received; the main
+        # thread, which owns the renderer, then discards the rest
+        self.renderer.request_cancel()
+        return True
+
+    def stream_completion(self, messages, model=None, **params):
+        """Start a streaming completion without printing; iterate it for content deltas"""
+        model = model or self.model
+        if self.cache is None and self.near_cache is None and self.flights is None:
+            return self._new_stream(model, messages, params)
+        
+        key = make_key(model, messages, params)
+        on_complete = None
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return CachedCompletion(model, messages, cached, metrics=self.metrics)
+        if self.near_cache is not None:
+            hit = self.near_cache.get(model, messages, params)
+            if hit is not None:
+                self.last_near_hit = hit
+                return CachedCompletion(model, messages, hit["response"], metrics=self.metrics,
+                                        similarity=hit["similarity"])
+        if self.cache is not None or self.near_cache is not None:
+            on_complete = lambda text, answered: self._remember(answered, messages, params, text)
+        if self.flights is None:
+            return self._new_stream(model, messages, params, on_complete=on_complete)
+        
+        # Identical requests already in flight share one upstream stream
+        flight, leader = self.flights.join(key)
+        if leader:
+            # Subscribers record their own metrics; the shared stream records none
+            flight.start(self._new_stream(model, messages, params, on_complete=on_complete,
+                                          record_metrics=False))
+        return CoalescedCompletion(flight, model, messages, leader, metrics=self.metrics)
+
+    def _remember(self, model, messages, params, text):
+        """Store a fully received answer in the response caches, under the model that gave it"""
+        if self.cache is not None:
+            self.cache.put(make_key(model, messages, params), text)
+        if self.near_cache is not None:
+            self.near_cache.put(model, messages, text, params)
+
+    def report_false_hit(self):
+        """Mark the last answer served for a similar prompt as wrong; False if there was none"""
+        if self.near_cache is None or self.last_near_hit is None:
+            return False
+        self.near_cache.report_false_hit(self.last_near_hit)
+        self.last_near_hit = None
+        return True
+
+    def failover_chain(self, model):
+        """The requested model followed by the others in FAILOVER_ORDER"""
+        if not self.failover:
+            return [model]
+        return [model] + [m for m in FAILOVER_ORDER if m != model]
+
+    def _new_stream(self, model, messages, params, on_complete=None, record_metrics=True):
+        return CompletionStream(self.client, model, messages, params, on_complete=on_complete,
+                                metrics=self.metrics if record_metrics else None,
+                                retry_policy=self.retry_policy, breakers=self.breakers,
+                                failover=self.failover_chain(model),
+                                first_token_timeout=self.first_token_timeout,
+                                chunk_timeout=self.chunk_timeout,
+                                limiter=self.limiter, priority=self.priority)
+
+    def context_budget(self):
+        """Prompt token budget for the current model"""
+        if self.context_budget_override:
+            return self.context_budget_override
+        return CONTEXT_TOKEN_BUDGETS.get(self.model, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+    def reset_history(self):
+        """Start a fresh conversation"""
+        self.history.clear()
+        self.session_id = None  # The next turn starts a new saved session
+
+    def resume_session(self, session_id):
+        """Continue a saved session, loading only the newest messages that fit the context"""
+        budget = self.context_budget() - self.history.system_tokens
+        self.history.clear()
+        for message in self.store.tail(session_id, budget):
+            self.history.append(message["role"], message["content"])
+        self.history.trim(self.context_budget())
+        self.session_id = session_id
+        return len(self.history)
+
+    def _save_turn(self, message, reply):
+        """Append a finished (or partial) turn to the session store"""
+        if self.store is None:
+            return
+        try:
+            if self.session_id is None:
+                self.session_id = self.store.create(title=message, model=self.model,
+                                                    system=self.history.system_message and
+                                                    self.history.system_message["content"])
+            self.store.append(self.session_id, "user", message, estimate_tokens(message))
+            self.store.append(self.session_id, "assistant", reply, estimate_tokens(reply))
+        except (OSError, ValueError) as e:
+            safe_print(f"[WARNING] Could not save the conversation: {e}")
+
     def display_response(self, message):
+        spinner = Spinner()
+        reply = DeltaBuffer()
+        stream = None
+        deltas = None
+        self.history.append("user", message)
+        if self.router is not None:
+            # Chosen before trimming: the context budget depends on the model
+            self.model, self.route_reason = self.router.choose(self.history.messages())
+        self.history.trim(self.context_budget())
+        self.report_warmup()
+        if self.warmer is not None:
+            self.warmer.touch()
         try:
-            # Show thinking animation
-            thinking_text = "Thinking..."
-            for i, char in enumerate(thinking_text):
-                print(char, end="", flush=True)
-                time.sleep(0.1)  # Faster thinking animation
+            # Show the thinking animation while the request is in flight
+            self.renderer.start()
+            spinner.start()
+            self.last_ttft = None
             
             # Make API call
-            stream = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": message}],
-                stream=True
-            )
-            
-            # Clear the "Thinking..." text once we get the first response
-            print("\b" * len(thinking_text), end="", flush=True)  # Move cursor back
-            print(" " * len(thinking_text), end="", flush=True)   # Overwrite with spaces
-            print("\b" * len(thinking_text), end="", flush=True)  # Move cursor back again
-            print("Chatbot: ", end="", flush=True)
+            stream = self.stream_completion(self.history.messages())
+            stream.defer_record = True  # Recorded below, once rendering is done
+            self.active_stream = stream
+            deltas = iter(stream)
             
             # Stream response with typing effect
-            for chunk in stream:
-                if (chunk.choices and 
-                    len(chunk.choices) > 0 and 
-                    chunk.choices[0].delta and 
-                    chunk.choices[0].delta.content):
-                    
-                    content = chunk.choices[0].delta.content
-                    # Add typing effect by printing each character with a small delay
-                    for char in content:
-                        try:
-                            print(char, end="", flush=True)
-                        except (UnicodeEncodeError, UnicodeError):
-                            # Handle specific Unicode characters gracefully
-                            if char in ['—', '–']:  # Em dash, en dash
-                                print('-', end="", flush=True)
-                            elif char in ['"', '"']:  # Smart quotes
-                                print('"', end="", flush=True)
-                            elif char in [''', ''']:  # Smart apostrophes
-                                print("'", end="", flush=True)
-                            elif char == '…':  # Ellipsis
-                                print('...', end="", flush=True)
-                            # Handle emojis that might be blocked
-                            elif ord(char) > 127:  # Non-ASCII character
-                                # Check if it's a common emoji and replace
-                                emoji_map = {
-                                    '🤖': '[robot]', '😊': ':)', '😢': ':(', '👍': '[thumbs-up]',
-                                    '❤️': '[heart]', '🎉': '[party]', '🔥': '[fire]', '⭐': '[star]',
-                                    '✨': '[sparkles]', '💡': '[idea]', '🚀': '[rocket]', '🌟': '[star]'
-                                }
-                                replacement = emoji_map.get(char, '[emoji]')
-                                print(replacement, end="", flush=True)
-                            else:
-                                # Skip other problematic characters
-                                pass
-                        time.sleep(0.01)  # Faster typing effect
+            for content in deltas:
+                if self.last_ttft is None:
+                    # Clear the animation once the first token arrives
+                    self.last_ttft = stream.ttft
+                    spinner.stop()
+                    print("Chatbot: ", end="", flush=True)
+                
+                reply.append(content)
+                self.renderer.feed(content)
             
+            spinner.stop()
+            if self.last_ttft is None:
+                print("Chatbot: ", end="", flush=True)
+            render_start = time.perf_counter()
+            self.renderer.finish()
+            stream.timer.add_render_time(time.perf_counter() - render_start)
+            if stream.cancelled:
+                raise ResponseCancelled()  # Cancelled while the reply was still being shown
+            text = reply.getvalue()
+            self.history.append("assistant", text)
+            self._save_turn(message, text)
             print()  # Add a newline at the end
+            if self.show_timing and stream.cached and stream.similarity is not None:
+                print(f"   (from cache: answer to a {stream.similarity:.0%} similar question; "
+                      f"type '/cache wrong' if it doesn't fit)")
+            elif self.show_timing and stream.cached:
+                print("   (from cache)")
+            elif self.show_timing and self.last_ttft is not None and self.router is not None:
+                print(f"   (first token in {self.last_ttft:.2f}s from {model_name(stream.model)}; "
+                      f"{self.route_reason})")
+            elif self.show_timing and self.last_ttft is not None:
+                print(f"   (first token in {self.last_ttft:.2f}s)")
             
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, ResponseCancelled):
+            if stream is not None:
+                stream.cancel()  # Free the connection before anything else
+            spinner.stop()
+            self.renderer.cancel()
+            self._end_turn(message, reply)
             safe_print("\n\n[STOP] Response cancelled by user")
         except Exception as e:
+            spinner.stop()
+            self._end_turn(message, reply)
+            if (not reply and self.router is not None and self.route_reason.startswith("complexity")
+                    and status_code(e) in (401, 403, 404) and self.router.mark_unavailable(self.model)):
+                # The routed model is not open to this API key (e.g. 70B needs special
+                # access): answer with the next model down instead of failing the turn
+                safe_print(f"\n[MODEL] {model_name(self.model)} is not available to this API key; "
+                           f"routing to other models from now on")
+                return self.display_response(message)
             safe_print(f"\n[ERROR] Error generating response: {e}")
             print("   Please check your internet connection and API key.")
+        finally:
+            self.active_stream = None
+            if deltas is not None:
+                deltas.close()  # Releases the HTTP stream if we stopped early
+            if stream is not None:
+                stream.record()
+            if self.warmer is not None:
+                self.warmer.touch()
+
+    def _end_turn(self, message, reply):
+        """Record an interrupted turn: keep a partial reply, or drop the unanswered prompt"""
+        if reply:
+            text = reply.getvalue()
+            self.history.append("assistant", text)
+            self._save_turn(message, text)
+        elif len(self.history) and self.history.messages()[-1]["role"] == "user":
+            self.history.pop()
 
 
 def configure_windows_console():
@@ -151,8 +1255,29 @@ def configure_windows_console():
     except Exception:
         return False
 
+def enable_ansi_styles():
+    """True if stdout shows ANSI colours and bold (switched on in Windows 10+ consoles)"""
+    if os.getenv('NO_COLOR') or not sys.stdout.isatty():
+        return False
+    if not sys.platform.startswith('win'):
+        return os.getenv('TERM', '') != 'dumb'
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+        mode = ctypes.c_uint32()
+        if not kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+            return False
+        # ENABLE_VIRTUAL_TERMINAL_PROCESSING; refused by consoles before Windows 10
+        return bool(kernel32.SetConsoleMode(handle, mode.value | 0x0004))
+    except Exception:
+        return False
+
 def test_unicode_support():
     """Test if the console can display Unicode characters properly"""
+    if not sys.stdout.isatty():
+        # Probe characters would end up in redirected output; check the encoding instead
+        return _can_encode("🤖⠀", getattr(sys.stdout, 'encoding', None) or 'ascii')
     try:
         # Test with progressively complex Unicode characters
         
@@ -174,32 +1299,17 @@ def test_unicode_support():
 
 def test_emoji_support():
     """Specifically test emoji support (separate from basic Unicode)"""
-    try:
-        # Test a simple emoji
-        test_emoji = "🤖"
-        
-        # Try to print and immediately capture if it works
-        import io
-        from contextlib import redirect_stdout
-        
-        output = io.StringIO()
-        with redirect_stdout(output):
-            print(test_emoji, end="")
-        
-        # If no exception, emojis should work
-        return True
-        
-    except (UnicodeEncodeError, UnicodeError, Exception):
-        return False
+    # Test a simple emoji against the console encoding (printing into a
+    # StringIO, as this used to do, can never fail and costs two imports)
+    test_emoji = "🤖"
+    return _can_encode(test_emoji, getattr(sys.stdout, 'encoding', None) or 'ascii')
 
 def print_robot():
     """Print robot ASCII art with intelligent fallback for Windows security restrictions"""
-    # Configure console (non-privileged methods only)
-    configure_windows_console()
-    
-    # Test Unicode and emoji support separately
-    unicode_supported = test_unicode_support()
-    emoji_supported = test_emoji_support() if unicode_supported else False
+    # Probe the console once (cached for safe_print and the renderers)
+    capabilities = detect_console_capabilities()
+    unicode_supported = capabilities['unicode']
+    emoji_supported = capabilities['emoji']
     
     # Decision tree based on capabilities
     if emoji_supported:
@@ -299,76 +1409,514 @@ def print_robot():
 def safe_print(text):
     """Print text with smart Unicode/emoji handling for Windows security contexts"""
     try:
-        # First try normal printing
-        print(text)
+        # Transcode once for this console; no per-character fallbacks needed
+        print(to_console(text))
     except (UnicodeEncodeError, UnicodeError):
-        # If that fails, use fallback
+        # Console changed underneath us, use fallback
         print_with_fallback(text)
 
 def print_with_fallback(text):
     """Print text with emoji/Unicode fallback"""
-    # Replace emojis with text equivalents
-    fallback_text = text.replace('🤖', '[AI]')
-    fallback_text = fallback_text.replace('✅', '[OK]')
-    fallback_text = fallback_text.replace('❌', '[ERROR]')
-    fallback_text = fallback_text.replace('⚠️', '[WARNING]')
-    fallback_text = fallback_text.replace('💡', '[TIP]')
-    fallback_text = fallback_text.replace('🚀', '[GO]')
-    fallback_text = fallback_text.replace('👋', '[WAVE]')
-    fallback_text = fallback_text.replace('⏹️', '[STOP]')
-    fallback_text = fallback_text.replace('🔑', '[KEY]')
-    fallback_text = fallback_text.replace('📦', '[PACKAGE]')
-    fallback_text = fallback_text.replace('🎉', '[PARTY]')
-    fallback_text = fallback_text.replace('💻', '[COMPUTER]')
-    fallback_text = fallback_text.replace('🌍', '[WORLD]')
-    fallback_text = fallback_text.replace('🎨', '[ART]')
+    # Replace emojis and typographic punctuation with text equivalents
+    fallback_text = text.translate(_FULL_FALLBACK_TABLE)
     
     try:
         print(fallback_text)
     except (UnicodeEncodeError, UnicodeError):
         # Last resort: ASCII only
-        ascii_text = ''.join(char if ord(char) < 128 else '?' for char in fallback_text)
-        print(ascii_text)
+        print(fallback_text.encode('ascii', 'replace').decode('ascii'))
+
+# Text equivalents for typographic punctuation legacy code pages cannot show
+PUNCTUATION_FALLBACKS = {
+    '\u2014': '-', '\u2013': '-',      # Em dash, en dash
+    '\u201c': '"', '\u201d': '"',      # Smart quotes
+    '\u2018': "'", '\u2019': "'",      # Smart apostrophes
+    '\u2026': '...',                   # Ellipsis
+    '\u2022': '*',                     # Bullet
+}
+
+# Text equivalents for emojis blocked by some Windows security contexts
+EMOJI_FALLBACKS = {
+    '🤖': '[AI]', '✅': '[OK]', '❌': '[ERROR]', '⚠': '[WARNING]',
+    '💡': '[TIP]', '🚀': '[GO]', '👋': '[WAVE]', '⏹': '[STOP]',
+    '🔑': '[KEY]', '📦': '[PACKAGE]', '🎉': '[PARTY]', '💻': '[COMPUTER]',
+    '🌍': '[WORLD]', '🎨': '[ART]', '😊': ':)', '😢': ':(',
+    '👍': '[thumbs-up]', '❤': '[heart]', '🔥': '[fire]', '⭐': '[star]',
+    '✨': '[sparkles]', '🌟': '[star]',
+    '\ufe0f': '',                      # Emoji presentation selector
+}
+
+_FULL_FALLBACK_TABLE = str.maketrans({**PUNCTUATION_FALLBACKS, **EMOJI_FALLBACKS})
+
+def build_fallback_table(encoding, emoji_supported):
+    """Precompile a str.translate table for what this console cannot display"""
+    fallbacks = {}
+    for char, replacement in PUNCTUATION_FALLBACKS.items():
+        if not _can_encode(char, encoding):
+            fallbacks[char] = replacement
+    for char, replacement in EMOJI_FALLBACKS.items():
+        if not emoji_supported or not _can_encode(char, encoding):
+            fallbacks[char] = replacement
+    return str.maketrans(fallbacks) if fallbacks else None
 
-# Global flag to detect emoji support
-_emoji_support_detected = None
+def _can_encode(text, encoding):
+    try:
+        text.encode(encoding)
+        return True
+    except (UnicodeEncodeError, UnicodeError, LookupError):
+        return False
+
+# Console capabilities, probed once per process
+_console_capabilities = None
+
+def console_cache_path():
+    """Per-user file remembering probe results between runs (used by --fast-start)"""
+    base = (os.getenv('LOCALAPPDATA') or os.getenv('XDG_CACHE_HOME')
+            or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'AI_Chatbot', 'console.json')
+
+def _console_fingerprint(encoding):
+    """Everything the probe result depends on: platform, encoding and terminal"""
+    return "|".join([sys.platform, encoding.lower(), str(sys.stdout.isatty()),
+                     os.getenv('TERM', ''), os.getenv('TERM_PROGRAM', ''),
+                     'wt' if os.getenv('WT_SESSION') else ''])
+
+def _load_console_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # A damaged or hand-edited file is ignored and rewritten after probing
+    return entries if isinstance(entries, dict) else {}
+
+def _valid_console_entry(entry):
+    return (isinstance(entry, dict) and isinstance(entry.get('unicode'), bool)
+            and isinstance(entry.get('emoji'), bool))
+
+def _save_console_cache(path, entries):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+    except OSError:
+        pass  # A read-only profile only costs the probe next time
+
+def detect_console_capabilities(cache_path=None):
+    """Probe the console once and cache its encoding, Unicode/emoji support and fallback table
+
+    With cache_path, results from an earlier run in the same kind of console
+    are reused instead of probing again.
+    """
+    global _console_capabilities
+    
+    if _console_capabilities is not None:
+        return _console_capabilities
+    
+    # Configure console (non-privileged methods only) before probing it
+    configure_windows_console()
+    encoding = getattr(sys.stdout, 'encoding', None) or 'ascii'
+    entries = _load_console_cache(cache_path) if cache_path else {}
+    fingerprint = _console_fingerprint(encoding)
+    remembered = entries.get(fingerprint)
+    if _valid_console_entry(remembered):
+        unicode_supported = remembered['unicode']
+        emoji_supported = remembered['emoji']
+    else:
+        unicode_supported = test_unicode_support()
+        emoji_supported = unicode_supported and test_emoji_support()
+        if cache_path:
+            entries[fingerprint] = {'unicode': unicode_supported, 'emoji': emoji_supported}
+            _save_console_cache(cache_path, entries)
+    try:
+        lossy = not codecs.lookup(encoding).name.startswith('utf')
+    except LookupError:
+        encoding, lossy = 'ascii', True
+    
+    _console_capabilities = {
+        'encoding': encoding,
+        'unicode': unicode_supported,
+        'emoji': emoji_supported,
+        # Non-UTF consoles need a final encode pass for characters not in the table
+        'lossy': lossy,
+        'table': build_fallback_table(encoding, emoji_supported),
+    }
+    return _console_capabilities
+
+def to_console(text):
+    """Transcode text for the current console in a single pass, without exceptions"""
+    capabilities = detect_console_capabilities()
+    if capabilities['table'] is not None:
+        text = text.translate(capabilities['table'])
+    if capabilities['lossy']:
+        encoding = capabilities['encoding']
+        text = text.encode(encoding, 'replace').decode(encoding)
+    return text
 
 def detect_emoji_support():
     """Detect and cache emoji support status"""
-    global _emoji_support_detected
-    
-    if _emoji_support_detected is not None:
-        return _emoji_support_detected
+    return detect_console_capabilities()['emoji']
+
+
+def add_cache_arguments(parser):
+    """Add the response cache options to an argument parser"""
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse answers to repeated prompts from an in-memory cache")
+    parser.add_argument("--cache-file", default=None, metavar="PATH",
+                        help="persist the response cache in this file (implies --cache)")
+    parser.add_argument("--cache-size", type=int, default=256, metavar="N",
+                        help="maximum cached responses kept in memory (default: 256)")
+    parser.add_argument("--cache-ttl", type=float, default=24 * 3600, metavar="SECONDS",
+                        help="how long cached responses stay valid (default: 86400)")
+    parser.add_argument("--near-cache", action="store_true",
+                        help="also reuse answers to prompts that differ from an earlier one only "
+                             "in punctuation, casing or a word or two")
+    parser.add_argument("--near-threshold", type=float, default=0.8, metavar="SIMILARITY",
+                        help="how similar (0-1) a prompt must be to reuse an answer (default: 0.8)")
+    parser.add_argument("--near-audit", default=None, metavar="PATH",
+                        help="append every near-duplicate hit and reported false hit to this "
+                             "JSONL file (implies --near-cache)")
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="give identical concurrent requests their own upstream streams "
+                             "instead of sharing one")
+
+def cache_from_args(args):
+    """Build the ResponseCache requested on the command line, if any"""
+    if args.cache or args.cache_file:
+        return ResponseCache(max_entries=args.cache_size, ttl=args.cache_ttl, path=args.cache_file)
+
+def near_cache_from_args(args):
+    """Build the NearDuplicateCache requested on the command line, if any"""
+    if args.near_cache or args.near_audit:
+        return NearDuplicateCache(threshold=args.near_threshold, max_entries=args.cache_size * 4,
+                                  ttl=args.cache_ttl, audit_path=args.near_audit)
+
+def print_cache_stats(cache, near_cache=None):
+    """Show response cache statistics"""
+    if cache is None and near_cache is None:
+        safe_print("[INFO] Response cache is off (start with --cache, --cache-file or --near-cache).")
+        return
+    if cache is not None:
+        stats = cache.stats()
+        safe_print(f"[CACHE] {stats['hits']} hits ({stats['disk_hits']} from disk), "
+                   f"{stats['misses']} misses, hit rate {stats['hit_rate']:.0%}")
+        safe_print(f"   {stats['entries']} entries in memory, {stats['evictions']} evicted, "
+                   f"{stats['expirations']} expired")
+    if near_cache is not None:
+        stats = near_cache.stats()
+        safe_print(f"[CACHE] Similar prompts: {stats['hits']} hits in {stats['lookups']} lookups "
+                   f"({stats['hit_rate']:.0%}), mean similarity {stats['mean_similarity']:.0%}, "
+                   f"threshold {stats['threshold']:.0%}")
+        safe_print(f"   {stats['false_hits']} reported wrong ({stats['false_hit_rate']:.0%}), "
+                   f"{stats['rejected_conflicts']} rejected for differing numbers or negation, "
+                   f"{stats['entries']} entries")
+        for hit in list(near_cache.audit_log)[-3:]:
+            flag = "  [reported wrong]" if hit.get("false_hit") else ""
+            safe_print(f"   {hit['similarity']:.0%}  '{hit['prompt'][:40]}' -> "
+                       f"'{hit['matched_prompt'][:40]}'{flag}")
+
+def add_resilience_arguments(parser):
+    """Add retry/timeout/failover options to an argument parser"""
+    parser.add_argument("--retries", type=int, default=4, metavar="N",
+                        help="attempts per response before giving up (default: 4)")
+    parser.add_argument("--no-failover", action="store_true",
+                        help="never switch to another model when the current one keeps failing")
+    parser.add_argument("--first-token-timeout", type=float, default=60.0, metavar="SECONDS",
+                        help="retry if no first token arrives in time (default: 60)")
+    parser.add_argument("--chunk-timeout", type=float, default=30.0, metavar="SECONDS",
+                        help="retry/resume if the stream stalls this long (default: 30)")
+
+def resilience_from_args(args):
+    """Chatbot keyword arguments for the resilience options"""
+    return {
+        "retry_policy": RetryPolicy(max_attempts=max(1, args.retries)),
+        "failover": not args.no_failover,
+        "first_token_timeout": args.first_token_timeout,
+        "chunk_timeout": args.chunk_timeout,
+    }
+
+def add_rate_limit_arguments(parser):
+    """Add client-side rate limit options to an argument parser"""
+    parser.add_argument("--rpm", type=float, default=None, metavar="N",
+                        help="send at most N requests per minute (queued, not failed)")
+    parser.add_argument("--tpm", type=float, default=None, metavar="N",
+                        help="use at most N prompt+completion tokens per minute")
+    parser.add_argument("--shared-limits", nargs="?", const="", default=None, metavar="PATH",
+                        help="share the --rpm/--tpm budget with other processes on this host "
+                             "through a state file (default: one in the temp directory)")
+
+def rate_limiter_from_args(args):
+    """Build the RateLimiter requested on the command line, if any"""
+    if args.rpm or args.tpm:
+        shared_path = args.shared_limits
+        if shared_path == "":
+            shared_path = default_shared_path()
+        return RateLimiter(args.rpm, args.tpm, shared_path=shared_path)
+
+def add_session_arguments(parser):
+    """Add the saved-conversation options to an argument parser"""
+    parser.add_argument("--sessions", nargs="?", const="", default=None, metavar="DIR",
+                        help="save conversations so they can be resumed and searched "
+                             "(default directory: ~/.ai_chatbot/sessions)")
+
+def session_store_from_args(args):
+    """Open the SessionStore requested on the command line, if any"""
+    if args.sessions is None:
+        return
+    # Imported here so start-up without --sessions stays light (sqlite3, mmap)
+    from session_store import SessionStore, default_store_path
+    return SessionStore(args.sessions or default_store_path())
+
+def add_router_arguments(parser):
+    """Add the model selection options to an argument parser"""
+    parser.add_argument("--model", default="3b", metavar="NAME",
+                        help=f"one of {', '.join(MODELS)} or a model id (default: 3b); 'auto' picks "
+                             f"a model per message from its complexity and recent latency")
+    parser.add_argument("--latency-budget", type=float, default=2.0, metavar="SECONDS",
+                        help="with --model auto, prefer faster models while a model's recent "
+                             "time to first token exceeds this (default: 2.0)")
+
+def router_from_args(args):
+    """Build the ModelRouter for the command-line options (pinned unless --model auto)"""
+    router = ModelRouter(FAILOVER_ORDER, latency_budget=args.latency_budget)
+    if args.model != "auto":
+        router.pin(MODELS.get(args.model, args.model))
+    return router
+
+def print_router(router):
+    """Show how models are being chosen and what latency each has shown"""
+    if router.pinned is not None:
+        safe_print(f"[MODEL] Pinned to {model_name(router.pinned)} (use '/model auto' to route again)")
+    else:
+        safe_print(f"[MODEL] Automatic: by message complexity, "
+                   f"first-token budget {router.latency_budget:g}s")
+    if router.override is not None:
+        safe_print(f"   Next message only: {model_name(router.override)}")
+    for model in router.unavailable:
+        safe_print(f"   {model_name(model):>4}  not available to this API key (skipped)")
+    for model, stats in router.snapshot().items():
+        if not stats["samples"]:
+            safe_print(f"   {model_name(model):>4}  no requests yet")
+            continue
+        speed = f"{stats['tokens_per_second']:.0f} tok/s" if stats["tokens_per_second"] else "- tok/s"
+        stale = "  (stale)" if stats["stale"] else ""
+        safe_print(f"   {model_name(model):>4}  first token ~{stats['ttft']:.2f}s  {speed}  "
+                   f"{stats['samples']} request{'s' if stats['samples'] != 1 else ''}{stale}")
+
+def model_command(router, argument):
+    """Handle '/model [auto | NAME | once NAME]'"""
+    words = argument.split()
+    if not words:
+        print_router(router)
+        return
+    if words[0].lower() == "auto":
+        router.unpin()
+        safe_print("[OK] Choosing the model automatically for each message.")
+        return
+    once = words[0].lower() == "once"
+    name = words[1] if once and len(words) > 1 else words[0]
+    model = MODELS.get(name.lower())
+    if model is None or (once and len(words) != 2) or (not once and len(words) != 1):
+        safe_print(f"[INFO] Usage: /model [auto | once NAME | NAME] with NAME one of {', '.join(MODELS)}")
+        return
+    if once:
+        router.override_next(model)
+        safe_print(f"[OK] Your next message goes to {name.lower()}.")
+    else:
+        router.pin(model)
+        safe_print(f"[OK] Using {name.lower()} for every message (use '/model auto' to undo).")
+
+def print_sessions(store):
+    """List recently saved conversations"""
+    if store is None:
+        safe_print("[INFO] Conversations are not being saved (start with --sessions).")
+        return
+    sessions = store.sessions(limit=10)
+    if not sessions:
+        safe_print("[INFO] No saved conversations yet.")
+        return
+    safe_print("[SESSIONS] Recent conversations (resume with /resume ID):")
+    for session in sessions:
+        updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(session["updated"]))
+        safe_print(f"   {session['id']}  {updated}  {session['messages']:>3} msgs  {session['title']}")
+
+def print_search_results(store, query):
+    """Show saved messages matching every keyword of query"""
+    if store is None:
+        safe_print("[INFO] Conversations are not being saved (start with --sessions).")
+        return
+    results = store.search(query)
+    if not results:
+        safe_print(f"[SEARCH] No saved messages match '{query}'.")
+        return
+    safe_print(f"[SEARCH] {len(results)} matching messages:")
+    for result in results:
+        safe_print(f"   {result['session']} #{result['seq']} ({result['role']}): {result['snippet']}")
+
+def print_stats(metrics):
+    """Show per-model latency and throughput statistics"""
+    lines = metrics.summary_lines()
+    if not lines:
+        safe_print("[INFO] No requests yet.")
+        return
+    safe_print("[STATS] Streaming performance:")
+    for line in lines:
+        safe_print("   " + line)
+
+def parse_args(argv=None):
+    """Parse command-line options"""
+    import argparse
     
-    _emoji_support_detected = test_emoji_support()
-    return _emoji_support_detected
+    parser = argparse.ArgumentParser(description="AI Chatbot powered by Together.ai")
+    parser.add_argument("--render", choices=sorted(RENDERERS), default="typing",
+                        help="output mode: 'typing' paces output like typing, 'raw' prints as it streams, "
+                             "'markdown' prints as it streams with headings, lists and code styled")
+    parser.add_argument("--typing-speed", type=int, default=120, metavar="CPS",
+                        help="characters per second for the typing renderer (default: 120)")
+    parser.add_argument("--context-budget", type=int, default=None, metavar="TOKENS",
+                        help="token budget for conversation history (default: per model)")
+    add_cache_arguments(parser)
+    parser.add_argument("--metrics-file", default=None, metavar="PATH",
+                        help="write latency/throughput metrics after each response "
+                             "(.json for a JSON snapshot, otherwise Prometheus text)")
+    add_resilience_arguments(parser)
+    add_rate_limit_arguments(parser)
+    add_session_arguments(parser)
+    add_router_arguments(parser)
+    parser.add_argument("--resume", nargs="?", const="last", default=None, metavar="ID",
+                        help="continue a saved conversation (the most recent one if no ID); "
+                             "implies --sessions")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="show the prompt sooner: reuse console checks from earlier runs "
+                             "and connect on the first message")
+    parser.add_argument("--no-prewarm", action="store_true",
+                        help="don't open the connection to Together.ai before the first message")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long each start-up step took")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
+    args = startup_profile.measure("parse arguments", parse_args)
     try:
-        print_robot()
-        chat = Chatbot()
+        startup_profile.measure("console probe", detect_console_capabilities,
+                                console_cache_path() if args.fast_start else None)
+        startup_profile.measure("banner", print_robot)
+        if args.render == "typing":
+            renderer = TypingRenderer(chars_per_second=args.typing_speed)
+        else:
+            renderer = args.render
+        chat = startup_profile.measure("chatbot setup", Chatbot, render_mode=renderer, context_budget=args.context_budget,
+                       cache=cache_from_args(args), near_cache=near_cache_from_args(args),
+                       coalesce=not args.no_coalesce,
+                       limiter=rate_limiter_from_args(args), lazy_client=args.fast_start,
+                       prewarm=not args.no_prewarm, router=router_from_args(args),
+                       **resilience_from_args(args))
+        if args.resume and args.sessions is None:
+            args.sessions = ""
+        chat.store = session_store_from_args(args)
+        if args.resume:
+            session_id = chat.store.resolve(args.resume)
+            if session_id is None:
+                safe_print(f"[WARNING] No saved conversation matches '{args.resume}'; starting a new one.")
+            else:
+                loaded = chat.resume_session(session_id)
+                safe_print(f"[OK] Resumed conversation {session_id} ({loaded} recent messages loaded).")
         
         safe_print("[TIP] Tips:")
-        print("   • Type your questions naturally")
-        print("   • Press Ctrl+C during response to cancel")
-        print("   • Type 'exit' to quit")
+        safe_print("   • Type your questions naturally")
+        safe_print("   • Press Ctrl+C or type '/cancel' during a response to stop it")
+        safe_print("   • Keep typing while a response streams: your next message is sent right after")
+        safe_print("   • Type '/clear' to start a new conversation, '/stats' for timings")
+        safe_print("   • Type '/model' to see or change which model answers")
+        if chat.store is not None:
+            safe_print("   • Type '/sessions', '/search WORDS' or '/resume ID' for saved conversations")
+        safe_print("   • Type 'exit' to quit")
         safe_print("   • Enjoy chatting with AI! [GO]")
         print()
+        if args.profile_startup:
+            startup_profile.report()
+            print()
+        
+        def cancel_command(line):
+            # Runs on the input thread, so it works while a response is streaming
+            return line.strip().lower() == '/cancel' and chat.cancel()
         
+        reader = InputReader(on_line=cancel_command).start()
         while True:
             try:
-                user_input = input("You: ").strip()
+                chat.report_warmup()
+                user_input, typed_ahead = reader.read("You: ")
+                user_input = user_input.strip()
+                if typed_ahead and user_input:
+                    safe_print(f"You (typed ahead): {user_input}")
                 
                 if not user_input:
+                    if typed_ahead:
+                        continue
+
                     print("Please enter a message.")
                     continue
                     
                 if user_input.lower() in ['exit', 'quit', 'bye']:
                     safe_print("[AI] Thanks for chatting! Goodbye! [WAVE]")
                     break
+                
+                if user_input.lower() == '/clear':
+                    chat.reset_history()
+                    safe_print("[OK] Conversation cleared.")
+                    continue
+                
+                if user_input.lower() == '/cache wrong':
+                    if chat.report_false_hit():
+                        safe_print("[OK] Noted; that answer won't be reused. Ask again for a fresh one.")
+                    else:
+                        safe_print("[INFO] The last answer didn't come from a similar prompt.")
+                    continue
+                
+                if user_input.lower() == '/cache':
+                    print_cache_stats(chat.cache, chat.near_cache)
+                    continue
+                
+                if user_input.lower() == '/sessions':
+                    print_sessions(chat.store)
+                    continue
+                
+                if user_input.lower().startswith('/search'):
+                    query = user_input[len('/search'):].strip()
+                    if query:
+                        print_search_results(chat.store, query)
+                    else:
+                        safe_print("[INFO] Usage: /search WORDS")
+                    continue
+                
+                if user_input.lower().startswith('/resume'):
+                    if chat.store is None:
+                        print_sessions(chat.store)
+                        continue
+                    session_id = chat.store.resolve(user_input[len('/resume'):].strip() or "last")
+                    if session_id is None:
+                        safe_print("[WARNING] No single saved conversation matches that ID (see /sessions).")
+                    else:
+                        loaded = chat.resume_session(session_id)
+                        safe_print(f"[OK] Resumed conversation {session_id} ({loaded} recent messages loaded).")
+                    continue
+                
+                if user_input.lower() == '/stats':
+                    print_stats(chat.metrics)
+                    continue
+                
+                if user_input.lower() == '/cancel':
+                    safe_print("[INFO] No response is streaming.")
+                    continue
+                
+                if user_input.lower().split()[0] == '/model':
+                    model_command(chat.router, user_input[len('/model'):])
+                    continue
                     
                 chat.enter_prompt(user_input)
+                if args.metrics_file:
+                    chat.metrics.write(args.metrics_file)
                 
             except KeyboardInterrupt:
                 safe_print("\n\n[AI] Thanks for chatting! Goodbye! [WAVE]")
@@ -0,0 +1,196 @@
+"""
+In-flight request coalescing
+Identical concurrent requests (same key as the response cache) share one
+upstream stream. The stream is read once into a shared buffer and fanned out
+to every subscriber; late joiners replay the chunks they missed from the
+buffer, then follow live. The upstream stream is cancelled when every
+subscriber has left.
+"""
+
+import threading
+
+
+class Flight:
+    """One upstream stream shared by several subscribers (threads)"""
+
+    def __init__(self, key, registry):
+        self.key = key
+        self.registry = registry
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.upstream = None
+        self._cond = threading.Condition()
+
+    def start(self, stream):
+        """Read `stream` (an iterable of deltas) on a helper thread"""
+        self.upstream = stream
+        threading.Thread(target=self._pump, args=(stream,), daemon=True).start()
+
+    def _pump(self, stream):
+        deltas = iter(stream)
+        try:
+            for content in deltas:
+                if self.abandoned:
+                    break
+                self.publish(content)
+        except Exception as e:
+            self.finish(e)
+            return
+        finally:
+            close = getattr(deltas, "close", None)
+            if close is not None:
+                close()  # Releases the HTTP stream if every subscriber left
+        self.finish()
+
+    @property
+    def abandoned(self):
+        return self.subscribers <= 0
+
+    def publish(self, content):
+        with self._cond:
+            self.chunks.append(content)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        # New requests for this key start a fresh flight (or hit the cache) from now on
+        self.registry.discard(self)
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def leave(self):
+        """A subscriber stopped reading"""
+        if self.registry.leave(self):
+            self.cancel()
+
+    def cancel(self):
+        """Stop the upstream stream, closing its HTTP response right away"""
+        cancel = getattr(self.upstream, "cancel", None)
+        if cancel is not None:
+            cancel()
+
+    def subscribe(self, stop=None):
+        """Every delta from the start of the stream: replayed, then live
+
+        Ends early, without an error, once stop() returns True.
+        """
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    if stop is not None and stop():
+                        return
+                    # Short waits keep Ctrl+C responsive on the main thread
+                    self._cond.wait(0.25)
+                pending = self.chunks[index:]
+                done = self.done
+            index += len(pending)
+            yield from pending
+            if done:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class AsyncFlight(Flight):
+    """Flight whose upstream is read by an asyncio task and consumed by coroutines"""
+
+    def __init__(self, key, registry):
+        import asyncio  # Only the server needs it; keeps chatbot start-up light
+        super().__init__(key, registry)
+        self.task = None
+        self.model = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        import asyncio
+        # Wake everyone waiting on the current event; later waiters get a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, content):
+        self.chunks.append(content)
+        self._notify()
+
+    def finish(self, error=None):
+        self.registry.discard(self)
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def subscribe_async(self):
+        """Every delta from the start of the stream: replayed, then live"""
+        index = 0
+        while True:
+            changed = self._changed  # Captured first so no publish is missed
+            pending = self.chunks[index:]
+            done = self.done
+            index += len(pending)
+            for content in pending:
+                yield content
+            if done:
+                if self.error is not None:
+                    raise self.error
+                return
+            if index >= len(self.chunks) and not self.done:
+                await changed.wait()
+
+
+class SingleFlight:
+    """Registry of in-flight requests by key"""
+
+    def __init__(self, flight_class=Flight):
+        self.flight_class = flight_class
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.upstream = 0
+        self.coalesced = 0
+
+    def join(self, key, share=True):
+        """(flight, leader): leader is True when the caller must start the upstream stream
+
+        With share=False the caller always gets a private flight of its own.
+        """
+        with self._lock:
+            flight = self._flights.get(key) if share else None
+            leader = flight is None
+            if leader:
+                flight = self.flight_class(key, self)
+                if share:
+                    self._flights[key] = flight
+                self.upstream += 1
+            else:
+                self.coalesced += 1
+            flight.subscribers += 1
+            return flight, leader
+
+    def leave(self, flight):
+        """Drop a subscriber; True if the flight is now abandoned mid-stream"""
+        with self._lock:
+            flight.subscribers -= 1
+            abandoned = flight.subscribers <= 0 and not flight.done
+            if abandoned and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            return abandoned
+
+    def discard(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def stats(self):
+        with self._lock:
+            requests = self.upstream + self.coalesced
+            return {
+                "in_flight": len(self._flights),
+                "upstream": self.upstream,
+                "coalesced": self.coalesced,
+                "saved_rate": self.coalesced / requests if requests else 0.0,
+            }
@@ -0,0 +1,107 @@
+"""
+Provider connection pooling and pre-warming
+A keep-alive HTTP client shared with the Together SDK, and a background
+warmer that opens the connection (DNS, TCP, TLS) while the user is still
+reading the banner or typing, then keeps it alive between turns.
+"""
+
+import threading
+import time
+
+DEFAULT_BASE_URL = "https://api.together.xyz/v1"
+
+# Idle pooled connections are kept this long; the warmer refreshes them sooner
+KEEPALIVE_SECONDS = 120.0
+
+
+def create_http_client(max_connections=10):
+    """Pooled keep-alive HTTP client for the SDK, or None if httpx is unavailable"""
+    try:
+        import httpx
+    except ImportError:
+        return
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections,
+                            keepalive_expiry=KEEPALIVE_SECONDS),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+    )
+
+
+class ConnectionWarmer:
+    """Opens the provider connection in the background and keeps it warm while idle
+
+    `connect` returns (http_client, base_url) and may be slow (e.g. it can
+    import the SDK); it runs on the warmer thread.
+    """
+
+    def __init__(self, connect, refresh_interval=30.0, max_idle=900.0):
+        self.connect = connect
+        self.refresh_interval = refresh_interval
+        self.max_idle = max_idle
+        self.ready = threading.Event()
+        self.ok = False
+        self.error = None
+        self.cold_seconds = None
+        self.saved_seconds = None
+        self.refreshes = 0
+        self.last_activity = time.monotonic()
+        self._stop = threading.Event()
+        self._http_client = None
+        self._url = None
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def touch(self):
+        """A real request used the connection"""
+        self.last_activity = time.monotonic()
+
+    def _request(self):
+        # Any response will do: the point is the pooled connection it leaves behind
+        started = time.perf_counter()
+        self._http_client.head(self._url)
+        return time.perf_counter() - started
+
+    def _run(self):
+        try:
+            self._http_client, self._url = self.connect()
+            if self._http_client is None:
+                raise RuntimeError("no pooled HTTP client (httpx missing or SDK too old)")
+            cold = self._request()
+            # A second request on the now-open connection shows what setup cost
+            warm = self._request()
+            self.cold_seconds = cold
+            self.saved_seconds = max(0.0, cold - warm)
+            self.ok = True
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready.set()
+        if not self.ok:
+            return
+
+        while not self._stop.wait(self.refresh_interval):
+            idle = time.monotonic() - self.last_activity
+            if idle > self.max_idle:
+                return  # Let the connection go after a long break
+            if idle >= self.refresh_interval:
+                try:
+                    self._request()
+                    self.refreshes += 1
+                except Exception:
+                    pass  # The next real request reconnects as usual
+
+    def summary(self):
+        """One-line outcome of the warm-up, or None while it is still running"""
+        if not self.ready.is_set():
+            return
+        if self.ok:
+            return (f"[OK] Connection to Together.ai pre-warmed in {self.cold_seconds:.2f}s "
+                    f"(saves ~{self.saved_seconds:.2f}s on your first message)")
+        return (f"[INFO] Connection warm-up failed ({self.error}); "
+                f"your first message will connect normally")
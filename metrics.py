@@ -0,0 +1,314 @@
+"""
+Streaming latency and throughput metrics
+RequestTimer records one streamed request (time to send, time to first token,
+inter-chunk gaps, tokens per second) while keeping time spent rendering
+separate from time spent waiting on the network. MetricsRegistry aggregates
+requests into per-model histograms and exports them as Prometheus text or a
+JSON snapshot.
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+GAP_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RATE_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+# name -> (buckets, help text)
+HISTOGRAMS = {
+    "queue_seconds": (LATENCY_BUCKETS, "Time waiting for the client-side rate limiter"),
+    "send_seconds": (LATENCY_BUCKETS, "Time until the API accepted the request (response headers)"),
+    "ttft_seconds": (LATENCY_BUCKETS, "Time to first content token"),
+    "inter_chunk_gap_seconds": (GAP_BUCKETS, "Network wait between streamed chunks"),
+    "network_seconds": (LATENCY_BUCKETS, "Request time spent waiting on the network"),
+    "render_seconds": (LATENCY_BUCKETS, "Request time spent rendering output"),
+    "total_seconds": (LATENCY_BUCKETS, "Wall-clock time per request"),
+    "tokens_per_second": (RATE_BUCKETS, "Completion tokens per second of streaming"),
+}
+
+COUNTERS = {
+    "requests_total": "Completed requests",
+    "errors_total": "Failed requests",
+    "retries_total": "Retried attempts (backoff, resumption or failover)",
+    "cache_hits_total": "Requests answered from the response cache",
+    "coalesced_total": "Requests that shared an identical in-flight request's stream",
+    "chunks_total": "Streamed content chunks",
+    "tokens_total": "Completion tokens",
+}
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative buckets, Prometheus style)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Estimate the q-th percentile (0-100) by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                # Observed extremes are tighter bounds than the bucket edges
+                lower = max(self.buckets[index - 1] if index > 0 else 0.0, self.min)
+                upper = min(self.buckets[index] if index < len(self.buckets) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.percentile(50), 6),
+            "p95": round(self.percentile(95), 6),
+            "p99": round(self.percentile(99), 6),
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class RequestTimer:
+    """Timing of one streamed request, with consumer (render) time kept apart"""
+
+    def __init__(self, model, cached=False, coalesced=False):
+        self.model = model
+        self.cached = cached
+        self.coalesced = coalesced
+        self.started = time.perf_counter()
+        self.send_seconds = None
+        self.ttft = None
+        self.gaps = []
+        self.chunks = 0
+        self.completion_tokens = 0
+        self.consumer_seconds = 0.0
+        self.queue_seconds = 0.0
+        self.extra_render_seconds = 0.0
+        self.total_seconds = None
+        self.error = None
+        self.retries = 0
+        self._waiting_since = self.started
+        self._handed_off_at = None
+
+    def queued(self, seconds):
+        """Time spent waiting for the rate limiter (kept out of TTFT and network time)"""
+        self.queue_seconds += seconds
+
+    def sent(self):
+        """The API accepted the request and the response stream is open"""
+        now = time.perf_counter()
+        if self.send_seconds is None:
+            self.send_seconds = now - self.started - self.queue_seconds
+        self._waiting_since = now
+
+    def chunk(self):
+        """A content chunk arrived from the network"""
+        now = time.perf_counter()
+        if self.ttft is None:
+            self.ttft = now - self.started - self.consumer_seconds - self.queue_seconds
+        else:
+            self.gaps.append(now - self._waiting_since)
+        self.chunks += 1
+
+    def handed_off(self):
+        """The chunk was handed to the consumer (e.g. the renderer)"""
+        self._handed_off_at = time.perf_counter()
+
+    def resumed(self):
+        """The consumer asked for the next chunk"""
+        now = time.perf_counter()
+        if self._handed_off_at is not None:
+            self.consumer_seconds += now - self._handed_off_at
+            self._handed_off_at = None
+        self._waiting_since = now
+
+    def add_render_time(self, seconds):
+        """Rendering done after the stream ended (e.g. draining typed output)"""
+        self.extra_render_seconds += seconds
+
+    def finish(self, completion_tokens=0, error=None):
+        self.resumed()
+        self.total_seconds = time.perf_counter() - self.started
+        self.completion_tokens = completion_tokens
+        self.error = error
+
+    @property
+    def render_seconds(self):
+        return self.consumer_seconds + self.extra_render_seconds
+
+    @property
+    def network_seconds(self):
+        return max(0.0, (self.total_seconds or 0.0) - self.consumer_seconds - self.queue_seconds)
+
+    @property
+    def tokens_per_second(self):
+        streaming = self.network_seconds - (self.ttft or 0.0)
+        if self.completion_tokens and streaming > 0:
+            return self.completion_tokens / streaming
+        return 0.0
+
+
+class MetricsRegistry:
+    """Thread-safe per-model aggregation of RequestTimer records"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, model) -> Histogram
+        self._counters = {}    # (name, model) -> int
+        self._listeners = []
+        self.started = time.time()
+
+    def add_listener(self, callback):
+        """Call callback(timer) after every recorded request"""
+        self._listeners.append(callback)
+
+    def _histogram(self, name, model):
+        key = (name, model)
+        if key not in self._histograms:
+            self._histograms[key] = Histogram(HISTOGRAMS[name][0])
+        return self._histograms[key]
+
+    def _count(self, name, model, amount=1):
+        self._counters[(name, model)] = self._counters.get((name, model), 0) + amount
+
+    def record(self, timer):
+        """Aggregate one finished request"""
+        self._aggregate(timer)
+        for callback in self._listeners:
+            callback(timer)
+
+    def _aggregate(self, timer):
+        with self._lock:
+            model = timer.model
+            if timer.retries:
+                self._count("retries_total", model, timer.retries)
+            if timer.error is not None:
+                self._count("errors_total", model)
+                return
+            self._count("requests_total", model)
+            self._count("chunks_total", model, timer.chunks)
+            self._count("tokens_total", model, timer.completion_tokens)
+            if timer.coalesced:
+                self._count("coalesced_total", model)
+            self._histogram("render_seconds", model).observe(timer.render_seconds)
+            self._histogram("total_seconds", model).observe(timer.total_seconds + timer.extra_render_seconds)
+            if timer.cached:
+                self._count("cache_hits_total", model)
+                return
+            if timer.queue_seconds:
+                self._histogram("queue_seconds", model).observe(timer.queue_seconds)
+            if timer.send_seconds is not None:
+                self._histogram("send_seconds", model).observe(timer.send_seconds)
+            if timer.ttft is not None:
+                self._histogram("ttft_seconds", model).observe(timer.ttft)
+            gaps = self._histogram("inter_chunk_gap_seconds", model)
+            for gap in timer.gaps:
+                gaps.observe(gap)
+            self._histogram("network_seconds", model).observe(timer.network_seconds)
+            if timer.tokens_per_second:
+                self._histogram("tokens_per_second", model).observe(timer.tokens_per_second)
+
+    def models(self):
+        with self._lock:
+            return sorted({model for _, model in list(self._counters) + list(self._histograms)})
+
+    def snapshot(self):
+        """JSON-serialisable view of every counter and histogram, by model"""
+        with self._lock:
+            result = {"uptime_seconds": round(time.time() - self.started, 3), "models": {}}
+            for (name, model), value in self._counters.items():
+                result["models"].setdefault(model, {})[name] = value
+            for (name, model), histogram in self._histograms.items():
+                result["models"].setdefault(model, {})[name] = histogram.snapshot()
+            return result
+
+    def to_prometheus(self, prefix="chatbot_"):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, help_text in COUNTERS.items():
+                series = [(m, v) for (n, m), v in self._counters.items() if n == name]
+                if not series:
+                    continue
+                lines.append(f"# HELP {prefix}{name} {help_text}")
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for model, value in sorted(series):
+                    lines.append(f'{prefix}{name}{{model="{model}"}} {value}')
+            for name, (_, help_text) in HISTOGRAMS.items():
+                series = [(m, h) for (n, m), h in self._histograms.items() if n == name]
+                if not series:
+                    continue
+                lines.append(f"# HELP {prefix}{name} {help_text}")
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for model, histogram in sorted(series, key=lambda item: item[0]):
+                    cumulative = 0
+                    for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f'{prefix}{name}_bucket{{model="{model}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{prefix}{name}_bucket{{model="{model}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{prefix}{name}_sum{{model="{model}"}} {histogram.sum:.6f}')
+                    lines.append(f'{prefix}{name}_count{{model="{model}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write a JSON snapshot (.json) or Prometheus text file (anything else)"""
+        if path.endswith(".json"):
+            content = json.dumps(self.snapshot(), indent=2)
+        else:
+            content = self.to_prometheus()
+        # Write atomically so scrapers never see a half-written file
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def summary_lines(self):
+        """Short human-readable per-model summary for the /stats command"""
+        snapshot = self.snapshot()
+        lines = []
+        for model, data in sorted(snapshot["models"].items()):
+            requests = data.get("requests_total", 0)
+            errors = data.get("errors_total", 0)
+            lines.append(f"{model}: {requests} requests, {errors} errors, "
+                         f"{data.get('cache_hits_total', 0)} cache hits, "
+                         f"{data.get('coalesced_total', 0)} coalesced, "
+                         f"{data.get('tokens_total', 0)} tokens")
+            ttft = data.get("ttft_seconds")
+            if ttft:
+                lines.append(f"   first token  p50 {ttft['p50']:.2f}s  p95 {ttft['p95']:.2f}s")
+            send = data.get("send_seconds")
+            if send:
+                lines.append(f"   send         p50 {send['p50']:.2f}s  p95 {send['p95']:.2f}s")
+            gaps = data.get("inter_chunk_gap_seconds")
+            if gaps:
+                lines.append(f"   chunk gap    p50 {gaps['p50'] * 1000:.0f}ms  p95 {gaps['p95'] * 1000:.0f}ms")
+            rate = data.get("tokens_per_second")
+            if rate:
+                lines.append(f"   throughput   mean {rate['mean']:.0f} tok/s")
+            queue = data.get("queue_seconds")
+            if queue:
+                lines.append(f"   rate limit   wait p50 {queue['p50']:.2f}s  p95 {queue['p95']:.2f}s")
+            network = data.get("network_seconds")
+            render = data.get("render_seconds")
+            if network and render:
+                lines.append(f"   time split   network {network['sum']:.2f}s, render {render['sum']:.2f}s")
+        return lines
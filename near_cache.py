@@ -0,0 +1,241 @@
+"""
+Near-duplicate prompt cache
+Answers prompts that differ from an earlier one only in punctuation, casing
+or a word or two. Prompts are normalised and cut into character n-grams
+(shingles). A MinHash signature of the shingles is indexed with
+locality-sensitive hashing (LSH), so only a handful of candidates are
+compared. A candidate is served when the Jaccard similarity of the shingles
+clears a threshold and the two prompts do not disagree on numbers or
+negation. Everything runs locally, and every near hit is kept in an audit
+log so false hits can be found and reported.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+
+from response_cache import make_key
+
+# Mersenne prime used by the MinHash permutations
+_PRIME = (1 << 61) - 1
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+# Small differences that flip the meaning of a prompt ("t" is what remains of "n't")
+NEGATIONS = frozenset(["not", "no", "never", "without", "cannot", "t"])
+ANTONYM_PREFIXES = ("un", "in", "im", "il", "ir", "dis", "non")
+
+def normalize_prompt(text):
+    """Lower-case words without punctuation, single-spaced"""
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def shingles(text, size=3):
+    """Hashed character n-grams of a normalised prompt"""
+    if len(text) <= size:
+        return frozenset([zlib.crc32(text.encode("utf-8"))])
+    return frozenset(zlib.crc32(text[i:i + size].encode("utf-8"))
+                     for i in range(len(text) - size + 1))
+
+
+def conflicting(a, b):
+    """True if two similar normalised prompts differ in a number, a negation or an un-/dis- prefix"""
+    words_a, words_b = set(a.split()), set(b.split())
+    if words_a & NEGATIONS != words_b & NEGATIONS:
+        return True
+    if {w for w in words_a if w.isdigit()} != {w for w in words_b if w.isdigit()}:
+        return True
+    words = words_a | words_b
+    for word in words_a ^ words_b:
+        for prefix in ANTONYM_PREFIXES:
+            if word.startswith(prefix) and word[len(prefix):] in words:
+                return True
+    return False
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures from `num_perm` random hash permutations"""
+
+    def __init__(self, num_perm=64, seed=1):
+        rng = random.Random(seed)  # Fixed seed: signatures are comparable across runs
+        self.permutations = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME))
+                             for _ in range(num_perm)]
+
+    def signature(self, hashes):
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self.permutations)
+
+
+class NearDuplicateCache:
+    """Approximate response cache keyed on the last user message
+
+    Only requests with the same model, parameters and system prompt are
+    compared, and only opening messages (system messages plus one user
+    message) are stored or answered. A later turn's answer depends on the
+    conversation before it, and in the server that conversation belongs to
+    another user.
+    """
+
+    def __init__(self, threshold=0.8, max_entries=1024, ttl=24 * 3600, num_perm=64, bands=16,
+                 shingle_size=3, audit_path=None, audit_size=100):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm)
+        self.audit_path = audit_path
+        self.audit_log = deque(maxlen=audit_size)  # Recent near hits, newest last
+        self._entries = OrderedDict()  # id -> entry dict, least recently used first
+        self._buckets = {}             # (context, band, rows) -> set of ids
+        self._ids = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.candidates = 0
+        self.similarity_total = 0.0
+        self.false_hits = 0
+        self.conflicts = 0
+        self.evictions = 0
+
+    def _split(self, model, messages, params):
+        """(context key, prompt, normalised prompt), or None if the request is not cacheable"""
+        if not messages or messages[-1].get("role") != "user":
+            return
+        prompt = str(messages[-1].get("content", ""))
+        normalized = normalize_prompt(prompt)
+        if not normalized:
+            return
+        system = messages[:-1]
+        if any(m.get("role") != "system" for m in system):
+            return  # A later turn: its answer may draw on the earlier ones
+        return make_key(model, system, params), prompt, normalized
+
+    def _band_keys(self, context, signature):
+        return [(context, band, signature[band * self.rows:(band + 1) * self.rows])
+                for band in range(self.bands)]
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["created"] > self.ttl
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for key in entry["bands"]:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def get(self, model, messages, params=None):
+        """The best earlier answer at or above the threshold, as an audit record, or None"""
+        split = self._split(model, messages, params)
+        if split is None:
+            return
+        context, prompt, normalized = split
+        hashes = shingles(normalized, self.shingle_size)
+        signature = self.hasher.signature(hashes)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            candidate_ids = set()
+            for key in self._band_keys(context, signature):
+                candidate_ids.update(self._buckets.get(key, ()))
+            best, best_similarity = None, 0.0
+            for entry_id in candidate_ids:
+                entry = self._entries[entry_id]
+                if self._expired(entry, now):
+                    self._remove(entry_id)
+                    continue
+                self.candidates += 1
+                similarity = (1.0 if entry["normalized"] == normalized
+                              else jaccard(hashes, entry["shingles"]))
+                if similarity > best_similarity:
+                    best, best_similarity = entry, similarity
+            if best is None or best_similarity < self.threshold:
+                return
+            if conflicting(normalized, best["normalized"]):
+                self.conflicts += 1
+                return
+            self._entries.move_to_end(best["id"])
+            self.hits += 1
+            self.similarity_total += best_similarity
+            hit = {"entry": best["id"], "time": round(now, 3), "model": model,
+                   "similarity": round(best_similarity, 3), "prompt": prompt,
+                   "matched_prompt": best["prompt"], "response": best["response"]}
+            self.audit_log.append(hit)
+        self._write_audit({key: value for key, value in hit.items() if key != "response"})
+        return hit
+
+    def put(self, model, messages, response, params=None):
+        """Index a completed answer under the last user message of its request"""
+        split = self._split(model, messages, params)
+        if split is None or not response:
+            return
+        context, prompt, normalized = split
+        hashes = shingles(normalized, self.shingle_size)
+        bands = self._band_keys(context, self.hasher.signature(hashes))
+        with self._lock:
+            self._ids += 1
+            entry = {"id": self._ids, "prompt": prompt, "normalized": normalized,
+                     "shingles": hashes, "bands": bands, "response": response,
+                     "created": time.time()}
+            self._entries[entry["id"]] = entry
+            for key in bands:
+                self._buckets.setdefault(key, set()).add(entry["id"])
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def report_false_hit(self, hit):
+        """Record that a served near hit did not answer the prompt; its entry is dropped"""
+        with self._lock:
+            self.false_hits += 1
+            hit["false_hit"] = True
+            if hit["entry"] in self._entries:
+                self._remove(hit["entry"])
+        self._write_audit({"false_hit": hit["entry"], "time": round(time.time(), 3),
+                           "prompt": hit["prompt"], "matched_prompt": hit["matched_prompt"],
+                           "similarity": hit["similarity"]})
+
+    def _write_audit(self, record):
+        if not self.audit_path:
+            return
+        try:
+            with open(self.audit_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError:
+            pass  # Auditing must never break answering
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        """Hit rate, candidate counts and false-hit statistics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "mean_similarity": self.similarity_total / self.hits if self.hits else 0.0,
+                "candidates_per_lookup": self.candidates / self.lookups if self.lookups else 0.0,
+                "false_hits": self.false_hits,
+                "false_hit_rate": self.false_hits / self.hits if self.hits else 0.0,
+                "rejected_conflicts": self.conflicts,
+                "evictions": self.evictions,
+                "threshold": self.threshold,
+            }
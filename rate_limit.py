@@ -0,0 +1,282 @@
+"""
+Client-side rate limiting for a shared API key
+Token buckets for requests per minute and tokens per minute. Requests that
+would exceed a limit wait in a priority queue instead of failing, and the
+bucket levels can live in a locked file so every process on the host draws
+from the same budget.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+if sys.platform.startswith('win'):
+    import msvcrt
+else:
+    import fcntl
+
+# Lower numbers are served first
+PRIORITY_RESUME = -1        # re-issuing a stream the user is already watching
+PRIORITY_INTERACTIVE = 0    # a person is waiting for the answer
+PRIORITY_BATCH = 10         # offline work
+
+# Completion tokens reserved up front when a request sets no max_tokens;
+# the difference is settled once the real usage is known
+EXPECTED_COMPLETION_TOKENS = 512
+
+
+def default_shared_path():
+    """State file used by --shared-limits when no path is given"""
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), "ai_chatbot_rate_limits.json")
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most `capacity`"""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+
+    def refill(self, level, updated, now):
+        return min(self.capacity, level + max(0.0, now - updated) * self.rate)
+
+    def wait_for(self, level, amount):
+        """Seconds until `amount` units are available"""
+        if level >= amount:
+            return 0.0
+        return (amount - level) / self.rate
+
+
+class LocalState:
+    """Bucket levels kept in this process"""
+
+    def __init__(self):
+        self.state = {}
+
+    @contextmanager
+    def locked(self):
+        yield self.state
+
+
+class SharedState:
+    """Bucket levels kept in a JSON file, locked while read and updated"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def locked(self):
+        with open(self.path, "a+", encoding="utf-8") as f:
+            self._lock(f)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}  # Corrupt or half-written by a crashed process: start full
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                self._unlock(f)
+
+    @staticmethod
+    def _lock(f):
+        if sys.platform.startswith('win'):
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    @staticmethod
+    def _unlock(f):
+        if sys.platform.startswith('win'):
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits with a priority queue
+
+    Only the waiter at the head of the queue (lowest priority number, then
+    arrival order) may take from the buckets, so urgent requests are never
+    starved by a backlog of batch work.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, shared_path=None):
+        self.buckets = {}
+        if requests_per_minute:
+            self.buckets["requests"] = TokenBucket(requests_per_minute)
+        if tokens_per_minute:
+            self.buckets["tokens"] = TokenBucket(tokens_per_minute)
+        self.shared_path = shared_path
+        self.store = SharedState(shared_path) if shared_path else LocalState()
+        self._cond = threading.Condition()
+        self._waiters = []  # heap of (priority, arrival)
+        self._async_waiters = {}  # entry -> (event loop, asyncio.Event) of acquire_async callers
+        self._arrivals = itertools.count()
+        self.acquired = 0
+        self.delayed = 0
+        self.waited_seconds = 0.0
+
+    def _take(self, tokens):
+        """Take one request and `tokens` if every bucket allows it; else seconds to wait"""
+        amounts = {"requests": 1, "tokens": tokens}
+        now = time.time()
+        with self.store.locked() as state:
+            levels = {}
+            wait = 0.0
+            for name, bucket in self.buckets.items():
+                level, updated = state.get(name, (bucket.capacity, now))
+                levels[name] = bucket.refill(level, updated, now)
+                # A request larger than the whole bucket waits for a full bucket
+                wait = max(wait, bucket.wait_for(levels[name], min(amounts[name], bucket.capacity)))
+            for name, bucket in self.buckets.items():
+                if not wait:
+                    levels[name] -= min(amounts[name], bucket.capacity)
+                state[name] = [levels[name], now]
+        return wait
+
+    def _poll(self, entry, tokens):
+        """(done, wait) for a queued waiter; wait is None when not at the head"""
+        if self._waiters[0] != entry:
+            return False, None
+        wait = self._take(tokens)
+        if wait:
+            return False, wait
+        heapq.heappop(self._waiters)
+        self._notify()
+        return True, 0.0
+
+    def _poll_locked(self, entry, tokens):
+        with self._cond:
+            return self._poll(entry, tokens)
+
+    def _notify(self):
+        """Wake every waiter, threads and coroutines alike (call with _cond held)"""
+        self._cond.notify_all()
+        for loop, event in self._async_waiters.values():
+            loop.call_soon_threadsafe(event.set)
+
+    def _enqueue(self, priority):
+        entry = (priority, next(self._arrivals))
+        heapq.heappush(self._waiters, entry)
+        return entry
+
+    def _dequeue(self, entry):
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._notify()
+
+    def _finish(self, started):
+        waited = time.monotonic() - started
+        self.acquired += 1
+        if waited > 0.01:  # Ignores lock and executor overhead
+            self.delayed += 1
+            self.waited_seconds += waited
+        return waited
+
+    def acquire(self, tokens=0, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Block until a request of `tokens` may be sent; returns seconds waited"""
+        if not self.buckets:
+            return 0.0
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        with self._cond:
+            entry = self._enqueue(priority)
+            try:
+                while True:
+                    done, wait = self._poll(entry, tokens)
+                    if done:
+                        return self._finish(started)
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError("Timed out waiting for the client-side rate limit")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    # Other processes may refill or drain a shared bucket meanwhile
+                    if wait is not None and self.shared_path:
+                        wait = min(wait, 1.0)
+                    self._cond.wait(wait)
+            except BaseException:
+                self._dequeue(entry)
+                raise
+
+    async def acquire_async(self, tokens=0, priority=PRIORITY_INTERACTIVE):
+        """acquire() for event-loop callers: waits on an asyncio.Event instead of blocking
+
+        Waiters behind the head of the queue sleep until the queue changes. A
+        shared state file is locked and read on an executor thread, so a
+        contended lock never stalls the event loop.
+        """
+        import asyncio  # Only the server needs it; keeps chatbot start-up light
+        if not self.buckets:
+            return 0.0
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        started = time.monotonic()
+        with self._cond:
+            entry = self._enqueue(priority)
+            self._async_waiters[entry] = (loop, wakeup)
+        try:
+            while True:
+                wakeup.clear()  # Cleared before polling so no notification is missed
+                if self.shared_path:
+                    done, wait = await loop.run_in_executor(None, self._poll_locked, entry, tokens)
+                else:
+                    done, wait = self._poll_locked(entry, tokens)
+                if done:
+                    with self._cond:
+                        return self._finish(started)
+                # Other processes may refill or drain a shared bucket meanwhile
+                if wait is not None and self.shared_path:
+                    wait = min(wait, 1.0)
+                try:
+                    await asyncio.wait_for(wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                self._dequeue(entry)
+            raise
+        finally:
+            with self._cond:
+                self._async_waiters.pop(entry, None)
+
+    def settle(self, reserved, used):
+        """Correct the token bucket once the real token usage of a request is known"""
+        bucket = self.buckets.get("tokens")
+        if bucket is None or used == reserved:
+            return
+        now = time.time()
+        with self._cond:
+            with self.store.locked() as state:
+                level, updated = state.get("tokens", (bucket.capacity, now))
+                # May go negative: later requests then wait for the overdraft to refill
+                level = bucket.refill(level, updated, now) + reserved - used
+                state["tokens"] = [level, now]
+            self._notify()
+
+    def stats(self):
+        """Queueing statistics"""
+        with self._cond:
+            return {
+                "acquired": self.acquired,
+                "delayed": self.delayed,
+                "waited_seconds": round(self.waited_seconds, 3),
+                "queued": len(self._waiters),
+                "shared": self.shared_path is not None,
+            }
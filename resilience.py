@@ -0,0 +1,197 @@
+"""
+Resilient streaming requests
+Jittered exponential backoff, first-token and inter-chunk timeouts, and
+per-model circuit breakers used to retry, resume and fail over streaming
+completions.
+"""
+
+import queue
+import random
+import threading
+import time
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits, server errors
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# SDK/transport exception names that indicate a transient failure
+RETRYABLE_ERROR_NAMES = ("RateLimit", "Timeout", "Connection", "ServiceUnavailable",
+                         "InternalServer", "RemoteProtocol", "ReadError", "StreamDropped")
+
+
+class StreamTimeout(Exception):
+    """No data arrived from the provider within the allowed time"""
+
+
+def status_code(error):
+    """HTTP status carried by an SDK exception, if any"""
+    for attribute in ("status_code", "http_status", "status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else 0
+
+
+def is_retryable(error):
+    """Whether a failed request is worth retrying"""
+    if isinstance(error, (StreamTimeout, ConnectionError, TimeoutError)):
+        return True
+    if status_code(error) in RETRYABLE_STATUSES:
+        return True
+    name = type(error).__name__
+    return any(marker in name for marker in RETRYABLE_ERROR_NAMES)
+
+
+def retry_after(error):
+    """Seconds requested by a Retry-After header, if the error carries one"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, error=None):
+        """Seconds to wait before retry number `attempt` (0-based)"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        wait = random.uniform(0, ceiling)
+        if error is not None:
+            wait = max(wait, min(retry_after(error), self.max_delay))
+        return wait
+
+
+class CircuitBreaker:
+    """Stops sending requests to a model after repeated failures
+
+    closed -> open after `failure_threshold` consecutive failures; after
+    `reset_timeout` seconds one trial request is let through (half-open) and
+    its outcome closes or re-opens the circuit. A trial that ends without an
+    outcome (cancelled, interrupted) is released; one that is never released
+    expires after `reset_timeout` so the model is tried again.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None  # When the current half-open trial was let through
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Whether a request may be sent now"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open":
+                now = time.monotonic()
+                if self._trial_started is None or now - self._trial_started >= self.reset_timeout:
+                    self._trial_started = now
+                    return True
+            return False
+
+    def release(self):
+        """A request ended without a success or failure to record (e.g. it was cancelled)"""
+        with self._lock:
+            self._trial_started = None
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_started = None
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per model"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, model):
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[model]
+
+    def states(self):
+        with self._lock:
+            return {model: breaker.state for model, breaker in self._breakers.items()}
+
+
+_END = object()
+
+
+def iter_with_timeouts(iterable, first_timeout=None, chunk_timeout=None, on_timeout=None):
+    """Iterate `iterable`, raising StreamTimeout when an item takes too long
+
+    The source is read on a helper thread so a silent connection cannot block
+    the caller forever; `on_timeout` (e.g. closing the HTTP stream) is called
+    before raising so the reader thread is released too.
+    """
+    if first_timeout is None and chunk_timeout is None:
+        yield from iterable
+        return
+
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def reader():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put((item, None))
+        except BaseException as e:
+            items.put((_END, e))
+            return
+        items.put((_END, None))
+
+    threading.Thread(target=reader, daemon=True).start()
+    first = True
+    try:
+        while True:
+            timeout = first_timeout if first else chunk_timeout
+            try:
+                item, error = items.get(timeout=timeout)
+            except queue.Empty:
+                if on_timeout is not None:
+                    on_timeout()
+                waited = "first token" if first else "next chunk"
+                raise StreamTimeout(f"No {waited} within {timeout:g}s")
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+            first = False
+    finally:
+        stop.set()
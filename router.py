@@ -0,0 +1,164 @@
+"""
+Latency-aware model routing
+Keeps a running (exponentially weighted) record of each model's time to
+first token and streaming speed, scores each prompt with a cheap complexity
+heuristic, and picks the smallest model that should handle it. When the
+preferred model's recent first-token latency exceeds the caller's budget,
+the router falls back to a faster model. A model the API key may not use
+(the request was refused) is skipped from then on.
+"""
+
+import threading
+import time
+
+# Words that usually ask for reasoning, long answers or code
+COMPLEX_MARKERS = ("explain", "why", "compare", "analy", "prove", "derive", "step by step",
+                   "design", "implement", "code", "debug", "optimi", "algorithm", "essay",
+                   "plan", "summari", "translate", "refactor", "architecture", "trade-off")
+
+
+def complexity(messages):
+    """Cheap 0-2 tier for a request: 0 = small talk, 1 = moderate, 2 = demanding"""
+    text = ""
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            text = message.get("content", "")
+            break
+    lowered = text.lower()
+    words = len(text.split())
+    score = 0
+    if words > 40:
+        score += 1
+    if words > 150:
+        score += 1
+    if "```" in text or "def " in text or "{" in text:
+        score += 1
+    score += min(2, sum(marker in lowered for marker in COMPLEX_MARKERS))
+    if text.count("?") > 1:
+        score += 1
+    if len(messages) > 12:
+        score += 1  # Long conversations need more capacity to stay coherent
+    if score <= 1:
+        return 0
+    return 1 if score <= 3 else 2
+
+
+class ModelStats:
+    """Exponentially weighted first-token latency and throughput of one model"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.ttft = None
+        self.tokens_per_second = None
+        self.samples = 0
+        self.updated = None
+
+    def observe(self, ttft, tokens_per_second=0.0):
+        if self.ttft is None:
+            self.ttft = ttft
+        else:
+            self.ttft += self.alpha * (ttft - self.ttft)
+        if tokens_per_second:
+            if self.tokens_per_second is None:
+                self.tokens_per_second = tokens_per_second
+            else:
+                self.tokens_per_second += self.alpha * (tokens_per_second - self.tokens_per_second)
+        self.samples += 1
+        self.updated = time.monotonic()
+
+
+class ModelRouter:
+    """Chooses a model per turn from prompt complexity and recent latencies
+
+    `models` runs from fastest to most capable. `latency_budget` is the
+    longest acceptable time to first token in seconds (None for no limit).
+    Latency records older than `stale_after` seconds are ignored, so a
+    model that was skipped for being slow is tried again later.
+    """
+
+    def __init__(self, models, latency_budget=None, alpha=0.3, stale_after=300.0):
+        self.models = list(models)
+        self.latency_budget = latency_budget
+        self.stale_after = stale_after
+        self.stats = {model: ModelStats(alpha) for model in self.models}
+        self.pinned = None     # Used for every turn until unpinned
+        self.override = None   # Used for the next turn only
+        self.unavailable = set()  # Models the API key was refused access to
+        self._lock = threading.Lock()
+
+    def pin(self, model):
+        self.pinned = model
+
+    def unpin(self):
+        self.pinned = None
+        self.override = None
+
+    def mark_unavailable(self, model):
+        """Stop routing to a model that refused the request; False if no other model is left"""
+        if model not in self.models:
+            return False
+        self.unavailable.add(model)
+        return any(m not in self.unavailable for m in self.models)
+
+    def override_next(self, model):
+        self.override = model
+
+    def observe(self, model, ttft, tokens_per_second=0.0):
+        """Record a finished request"""
+        with self._lock:
+            stats = self.stats.get(model)
+            if stats is None:
+                stats = self.stats[model] = ModelStats()
+            stats.observe(ttft, tokens_per_second)
+
+    def observe_timer(self, timer):
+        """MetricsRegistry listener: learn from every live (not cached) request"""
+        if timer.error is None and not timer.cached and not timer.coalesced and timer.ttft is not None:
+            self.observe(timer.model, timer.ttft, timer.tokens_per_second)
+
+    def recent_ttft(self, model):
+        """Recent first-token latency of a model, or None if unknown or stale"""
+        with self._lock:
+            stats = self.stats.get(model)
+            if stats is None or stats.ttft is None:
+                return
+            if time.monotonic() - stats.updated > self.stale_after:
+                return
+            return stats.ttft
+
+    def choose(self, messages):
+        """(model, reason) for the next request"""
+        if self.override is not None:
+            model, self.override = self.override, None
+            return model, "override"
+        if self.pinned is not None:
+            return self.pinned, "pinned"
+        tier = min(complexity(messages), len(self.models) - 1)
+        index = tier
+        # Models the key cannot use are replaced by the next faster one, or the next slower
+        while index > 0 and self.models[index] in self.unavailable:
+            index -= 1
+        while index < len(self.models) - 1 and self.models[index] in self.unavailable:
+            index += 1
+        if self.latency_budget is not None:
+            # Step down to faster models while the recent latency is over budget
+            while index > 0 and self.models[index - 1] not in self.unavailable:
+                ttft = self.recent_ttft(self.models[index])
+                if ttft is None or ttft <= self.latency_budget:
+                    break
+                index -= 1
+        reason = f"complexity {tier}"
+        if self.models[tier] in self.unavailable:
+            reason += f", {self.models[tier]} not available to this API key"
+        elif index != tier:
+            reason += f", {self.models[tier]} over the {self.latency_budget:g}s budget"
+        return self.models[index], reason
+
+    def snapshot(self):
+        """Per-model latency record"""
+        with self._lock:
+            now = time.monotonic()
+            return {model: {"ttft": stats.ttft, "tokens_per_second": stats.tokens_per_second,
+                            "samples": stats.samples,
+                            "stale": stats.updated is not None and now - stats.updated > self.stale_after}
+                    for model, stats in self.stats.items()}
@@ -0,0 +1,702 @@
+#!/usr/bin/env python3
+"""
+AI Chatbot Server
+Hosts many concurrent chat sessions from one asyncio process and streams
+model output to each client as Server-Sent Events (SSE).
+
+All sessions share a single pooled, keep-alive async client to Together.ai,
+so an idle session costs no thread and no connection.
+
+Endpoints:
+    POST   /sessions                 create a session  {"system": "...", "model": "70b"}
+    POST   /sessions/<id>/messages   send a message    {"content": "..."}  -> SSE stream
+    GET    /sessions/<id>            session size and memory use
+    DELETE /sessions/<id>            end a session (and delete it from the store)
+    GET    /sessions                 saved sessions, newest first (admin, with --sessions)
+    GET    /search?q=words           saved messages matching every keyword (admin, with --sessions)
+    GET    /health                   server status, including resident session memory
+    GET    /stats                    latency/throughput metrics (JSON)
+    GET    /metrics                  latency/throughput metrics (Prometheus text)
+
+A session id is the only credential for its conversation, so the admin
+endpoints, which reveal every user's sessions, are disabled unless the
+server has an --admin-token and the request sends it as a Bearer token.
+"""
+
+import argparse
+import asyncio
+import functools
+import hmac
+import inspect
+import json
+import os
+import sys
+import time
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+from chatbot import (Chatbot, ConversationHistory, CONTEXT_TOKEN_BUDGETS, DeltaBuffer,
+                     DEFAULT_CONTEXT_TOKEN_BUDGET, FAILOVER_ORDER, MODELS, chunk_content,
+                     add_cache_arguments, cache_from_args, near_cache_from_args, estimate_tokens,
+                     add_session_arguments, session_store_from_args,
+                     add_rate_limit_arguments, rate_limiter_from_args)
+from coalesce import AsyncFlight, SingleFlight
+from metrics import MetricsRegistry, RequestTimer
+from rate_limit import EXPECTED_COMPLETION_TOKENS
+from resilience import CircuitBreakers, RetryPolicy, is_retryable
+from response_cache import make_key
+
+MAX_BODY_BYTES = 1024 * 1024
+
+REASONS = {
+    200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request",
+    401: "Unauthorized", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    """An error answered with an HTTP status and JSON body"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def create_async_client(api_key, max_connections=100):
+    """One shared AsyncTogether client backed by a pooled keep-alive HTTP client"""
+    from together import AsyncTogether
+
+    try:
+        import httpx
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+    except ImportError:
+        return AsyncTogether(api_key=api_key)
+    try:
+        return AsyncTogether(api_key=api_key, http_client=http_client)
+    except TypeError:
+        # Older SDKs manage their own connection pool
+        return AsyncTogether(api_key=api_key)
+
+
+async def close_stream(stream):
+    """Close an SDK stream so its connection goes back to the pool"""
+    for name in ("aclose", "close"):
+        close = getattr(stream, name, None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+            return
+
+
+class ChatSession:
+    """One client's conversation"""
+
+    def __init__(self, model, system_prompt=None, session_id=None):
+        self.id = session_id or uuid.uuid4().hex
+        self.model = model
+        self.system_prompt = system_prompt
+        self.saved = False  # Registered in the session store
+        self.history = ConversationHistory(system_prompt)
+        self.busy = False
+        self.last_active = time.monotonic()
+
+    def context_budget(self):
+        return CONTEXT_TOKEN_BUDGETS.get(self.model, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+    @property
+    def memory_bytes(self):
+        """Bytes held by this session's conversation"""
+        return self.history.memory_bytes
+
+    def info(self):
+        return {"session_id": self.id, "model": self.model, "messages": len(self.history),
+                "tokens": self.history.total_tokens, "memory_bytes": self.memory_bytes,
+                "busy": self.busy}
+
+
+class ChatServer:
+    """Asyncio HTTP server streaming chat completions over SSE"""
+
+    def __init__(self, client, model=MODELS["3b"], max_sessions=10000,
+                 max_streams=256, idle_timeout=1800, cache=None, metrics=None,
+                 retry_policy=None, failover=True, limiter=None, coalesce=True,
+                 store=None, max_memory=None, near_cache=None, admin_token=None):
+        self.client = client
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.failover = failover
+        self.breakers = CircuitBreakers()
+        self.limiter = limiter
+        self.model = model
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.cache = cache
+        self.near_cache = near_cache  # Answers prompts close to an earlier one
+        # Optional SessionStore: turns are saved, and unknown session ids are
+        # restored from it (e.g. after a restart or idle expiry)
+        self.store = store
+        # Required (as "Authorization: Bearer <token>") to list or search every
+        # user's sessions; without it those endpoints are off
+        self.admin_token = admin_token
+        self.sessions = {}
+        self.active_streams = 0
+        # Conversation memory of resident sessions, kept up to date as turns
+        # change it; above max_memory bytes the least recently active idle
+        # sessions are spilled to the store (they are restored on their next request)
+        self.max_memory = max_memory
+        self.resident_bytes = 0
+        self.spilled = 0
+        # Identical concurrent turns share one upstream stream
+        self.coalesce = coalesce
+        self.flights = SingleFlight(AsyncFlight)
+        # Bounds concurrent upstream streams; extra turns wait their turn
+        self._stream_slots = asyncio.Semaphore(max_streams)
+
+    # Sessions
+
+    async def run_store(self, method, *args, **kwargs):
+        """Call a SessionStore method on an executor thread
+
+        Its file I/O and SQLite commits would otherwise stall every stream.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(method, *args, **kwargs))
+
+    async def create_session(self, model=None, system_prompt=None):
+        for field, value in (("model", model), ("system", system_prompt)):
+            if value is not None and not isinstance(value, str):
+                raise HTTPError(400, f"'{field}' must be a string")
+        if len(self.sessions) >= self.max_sessions:
+            await self.expire_idle_sessions()
+        if len(self.sessions) >= self.max_sessions:
+            raise HTTPError(503, "Too many sessions")
+        model = MODELS.get(model, model) if model else self.model
+        session = ChatSession(model, system_prompt)
+        await self.add_session(session)
+        return session
+
+    async def add_session(self, session):
+        self.sessions[session.id] = session
+        self.resident_bytes += session.memory_bytes
+        await self.enforce_memory_limit()
+
+    def remove_session(self, session_id):
+        session = self.sessions.pop(session_id)
+        self.resident_bytes -= session.memory_bytes
+        return session
+
+    async def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = await self.restore_session(session_id)
+        if session is None:
+            raise HTTPError(404, "Unknown session")
+        return session
+
+    async def restore_session(self, session_id):
+        """Rebuild a saved session, loading only the newest messages that fit its context"""
+        if self.store is None:
+            return
+        try:
+            info = await self.run_store(self.store.info, session_id)
+        except ValueError:
+            return
+        if info is None:
+            return
+        session = ChatSession(info["model"] or self.model, info["system"], session_id)
+        session.saved = True
+        budget = session.context_budget() - session.history.system_tokens
+        messages = await self.run_store(self.store.tail, session_id, budget)
+        resident = self.sessions.get(session_id)
+        if resident is not None:
+            return resident  # Restored by a concurrent request meanwhile
+        for message in messages:
+            session.history.append(message["role"], message["content"])
+        session.history.trim(session.context_budget())
+        await self.add_session(session)
+        return session
+
+    def save_turn(self, session, content, reply):
+        """Append a finished (or partial) turn to the session store (blocking: run it on an executor)"""
+        if self.store is None:
+            return
+        try:
+            if not session.saved:
+                self.store.create(session.id, title=content, model=session.model,
+                                  system=session.system_prompt)
+                session.saved = True
+            self.store.append(session.id, "user", content, estimate_tokens(content))
+            self.store.append(session.id, "assistant", reply, estimate_tokens(reply))
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Could not save session {session.id}: {e}", file=sys.stderr)
+
+    async def spill_session(self, session):
+        """Drop a session from memory; with a store it can be restored later"""
+        if self.store is not None and not session.saved:
+            # Every turn is already saved; a session without turns is registered
+            # so its model and system prompt survive
+            try:
+                await self.run_store(self.store.create, session.id, model=session.model,
+                                     system=session.system_prompt)
+                session.saved = True
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Could not save session {session.id}: {e}", file=sys.stderr)
+        if session.busy or self.sessions.get(session.id) is not session:
+            return  # Back in use, deleted or already spilled while it was being registered
+        self.remove_session(session.id)
+        if self.store is not None:
+            self.spilled += 1
+
+    async def expire_idle_sessions(self):
+        """Spill (or, without a store, forget) sessions idle for longer than idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        for session in [s for s in self.sessions.values()
+                        if not s.busy and s.last_active < cutoff]:
+            await self.spill_session(session)
+
+    async def enforce_memory_limit(self):
+        """Spill the least recently active idle sessions until memory is under max_memory"""
+        if self.max_memory is None or self.resident_bytes <= self.max_memory:
+            return
+        idle = sorted((s for s in self.sessions.values() if not s.busy),
+                      key=lambda s: s.last_active)
+        for session in idle:
+            if self.resident_bytes <= self.max_memory:
+                break
+            await self.spill_session(session)
+
+    def memory_stats(self):
+        return {
+            "resident_sessions": len(self.sessions),
+            "resident_bytes": self.resident_bytes,
+            "limit_bytes": self.max_memory,
+            "spilled": self.spilled,
+        }
+
+    async def expiry_loop(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            await self.expire_idle_sessions()
+
+    # HTTP
+
+    async def handle_connection(self, reader, writer):
+        try:
+            method, path, body, headers = await self.read_request(reader)
+            await self.dispatch(method, path, body, writer, headers)
+        except HTTPError as e:
+            await self.send_json(writer, e.status, {"error": e.message})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            # A bug must not leave the client without an answer
+            print(f"[ERROR] Request failed: {type(e).__name__}: {e}", file=sys.stderr)
+            try:
+                await self.send_json(writer, 500, {"error": "Internal server error"})
+            except (ConnectionError, OSError):
+                pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            raise ConnectionError("Client closed connection")
+        try:
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise HTTPError(400, "Malformed Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Malformed Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = {}
+        if length:
+            raw = await reader.readexactly(length)
+            try:
+                body = json.loads(raw.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                raise HTTPError(400, "Body must be JSON")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "Body must be a JSON object")
+        return method.upper(), path, body, headers
+
+    def require_admin(self, headers):
+        """Raise unless the request carries the admin token"""
+        if not self.admin_token:
+            raise HTTPError(404, "Not found (start the server with --admin-token to enable)")
+        supplied = (headers or {}).get("authorization", "")
+        if not supplied:
+            raise HTTPError(401, "Send 'Authorization: Bearer <admin token>'")
+        if not hmac.compare_digest(supplied.encode("utf-8"),
+                                   f"Bearer {self.admin_token}".encode("utf-8")):
+            raise HTTPError(403, "Wrong admin token")
+
+    async def dispatch(self, method, path, body, writer, headers=None):
+        url = urlsplit(path)
+        parts = [p for p in url.path.split("/") if p]
+
+        if parts == ["health"] and method == "GET":
+            await self.send_json(writer, 200, {
+                "status": "ok",
+                "sessions": len(self.sessions),
+                "active_streams": self.active_streams,
+                "coalescing": self.flights.stats(),
+                "memory": self.memory_stats(),
+                "near_cache": self.near_cache.stats() if self.near_cache is not None else None,
+            })
+        elif parts == ["stats"] and method == "GET":
+            await self.send_json(writer, 200, self.metrics.snapshot())
+        elif parts == ["metrics"] and method == "GET":
+            await self.send_text(writer, 200, self.metrics.to_prometheus(),
+                                 "text/plain; version=0.0.4")
+        elif parts == ["sessions"] and method == "POST":
+            session = await self.create_session(body.get("model"), body.get("system"))
+            await self.send_json(writer, 201, {"session_id": session.id, "model": session.model})
+        elif parts == ["sessions"] and method == "GET":
+            self.require_admin(headers)
+            if self.store is None:
+                raise HTTPError(404, "Sessions are not being saved (start with --sessions)")
+            sessions = await self.run_store(self.store.sessions, limit=50)
+            await self.send_json(writer, 200, {"sessions": sessions})
+        elif parts == ["search"] and method == "GET":
+            self.require_admin(headers)
+            if self.store is None:
+                raise HTTPError(404, "Sessions are not being saved (start with --sessions)")
+            query = parse_qs(url.query).get("q", [""])[0]
+            if not query.strip():
+                raise HTTPError(400, "Pass the keywords as ?q=")
+            results = await self.run_store(self.store.search, query)
+            await self.send_json(writer, 200, {"results": results})
+        elif len(parts) == 2 and parts[0] == "sessions" and method == "GET":
+            session = await self.get_session(parts[1])
+            await self.send_json(writer, 200, session.info())
+        elif len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+            session = await self.get_session(parts[1])
+            if session.busy:
+                # Its turn is still streaming or being saved; deleting now would
+                # let that save recreate the files
+                raise HTTPError(409, "A response is still streaming for this session")
+            self.remove_session(parts[1])
+            if self.store is not None:
+                await self.run_store(self.store.delete, parts[1])
+            await self.send_json(writer, 204, None)
+        elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages":
+            if method != "POST":
+                raise HTTPError(405, "Use POST")
+            session = await self.get_session(parts[1])
+            content = body.get("content")
+            if not isinstance(content, str) or not content.strip():
+                raise HTTPError(400, "'content' must be a non-empty string")
+            await self.stream_turn(session, content.strip(), writer)
+        else:
+            raise HTTPError(404, "Not found")
+
+    async def send_json(self, writer, status, payload):
+        body = "" if payload is None else json.dumps(payload)
+        await self.send_text(writer, status, body, "application/json")
+
+    async def send_text(self, writer, status, text, content_type):
+        body = text.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def send_event(self, writer, data, event=None):
+        message = f"event: {event}\n" if event else ""
+        message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        writer.write(message.encode("utf-8"))
+        await writer.drain()
+
+    # Chat
+
+    @staticmethod
+    def reserve_tokens(messages):
+        """Tokens a request reserves from the rate limiter before its usage is known"""
+        return sum(estimate_tokens(m.get("content", "")) for m in messages) + EXPECTED_COMPLETION_TOKENS
+
+    async def open_stream(self, model, messages, timer):
+        """Open an upstream stream, retrying with backoff and failing over between models
+
+        Returns the stream and the tokens reserved from the rate limiter; if
+        no stream can be opened, the reservation is refunded.
+        """
+        chain = [model] + ([m for m in FAILOVER_ORDER if m != model] if self.failover else [])
+        index = 0
+        tokens = self.reserve_tokens(messages)
+        reserved = 0
+        try:
+            for attempt in range(self.retry_policy.max_attempts):
+                # Skip models whose circuit is open
+                for offset in range(len(chain)):
+                    candidate = chain[(index + offset) % len(chain)]
+                    if self.breakers[candidate].allow():
+                        break
+                else:
+                    raise RuntimeError("All models are temporarily unavailable (circuit open)")
+                if self.limiter is not None:
+                    timer.queued(await self.limiter.acquire_async(tokens))
+                    reserved += tokens
+                try:
+                    stream = await self.client.chat.completions.create(
+                        model=candidate, messages=messages, stream=True)
+                except Exception as e:
+                    if not is_retryable(e):
+                        # The request's fault (e.g. a 4xx), not an outage of the model
+                        self.breakers[candidate].release()
+                        raise
+                    self.breakers[candidate].record_failure()
+                    if attempt + 1 >= self.retry_policy.max_attempts:
+                        raise
+                    timer.retries += 1
+                    if attempt % 2 == 1:
+                        index += 1
+                    await asyncio.sleep(self.retry_policy.delay(attempt, e))
+                    continue
+                except BaseException:
+                    # The client went away mid-request: a half-open trial learned nothing
+                    self.breakers[candidate].release()
+                    raise
+                self.breakers[candidate].record_success()
+                timer.model = candidate
+                return stream, reserved
+            raise RuntimeError("Retries exhausted")
+        except BaseException:
+            if reserved:
+                self.limiter.settle(reserved, 0)  # Nothing was generated: refund the reservation
+            raise
+
+    async def pump(self, flight, model, messages, timer):
+        """Read one upstream stream into a flight shared by its subscribers
+
+        `timer` belongs to the turn that started the flight and receives the
+        retry, queueing and model details.
+        """
+        flight.model = model
+        stream = None
+        reserved = 0
+        try:
+            async with self._stream_slots:
+                self.active_streams += 1
+                try:
+                    stream, reserved = await self.open_stream(model, messages, timer)
+                    flight.model = timer.model
+                    async for chunk in stream:
+                        delta = chunk_content(chunk)
+                        if delta:
+                            flight.publish(delta)
+                finally:
+                    self.active_streams -= 1
+                    if stream is not None:
+                        await close_stream(stream)
+        except asyncio.CancelledError:
+            # Every subscriber left
+            flight.finish(ConnectionError("Stream cancelled"))
+            raise
+        except Exception as e:
+            flight.finish(e)
+        else:
+            flight.finish()
+            # Cached under the model that answered, which differs after a failover
+            if flight.chunks and self.cache is not None:
+                self.cache.put(make_key(flight.model, messages), "".join(flight.chunks))
+            if flight.chunks and self.near_cache is not None:
+                self.near_cache.put(flight.model, messages, "".join(flight.chunks))
+        finally:
+            if reserved:
+                prompt_tokens = self.reserve_tokens(messages) - EXPECTED_COMPLETION_TOKENS
+                completion_tokens = sum(len(chunk) for chunk in flight.chunks) // 4
+                self.limiter.settle(reserved, prompt_tokens + completion_tokens)
+
+    async def stream_turn(self, session, content, writer):
+        """Run one chat turn and stream its deltas to the client as SSE"""
+        if session.busy:
+            raise HTTPError(409, "A response is already streaming for this session")
+        session.busy = True
+        session.last_active = time.monotonic()
+        memory_before = session.memory_bytes
+        session.history.append("user", content)
+        session.history.trim(session.context_budget())
+        messages = session.history.messages()
+
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+        reply = DeltaBuffer()
+        start = time.perf_counter()
+        ttft = None
+        timer = None
+        error = None
+        flight = None
+        try:
+            key = make_key(session.model, messages)
+            cached = self.cache.get(key) if self.cache is not None else None
+            similarity = None
+            if cached is None and self.near_cache is not None:
+                hit = self.near_cache.get(session.model, messages)
+                if hit is not None:
+                    cached, similarity = hit["response"], hit["similarity"]
+            timer = RequestTimer(session.model, cached=cached is not None)
+            if cached is not None:
+                reply.append(cached)
+                ttft = 0.0
+                timer.sent()
+                timer.chunk()
+                timer.handed_off()
+                await self.send_event(writer, {"delta": cached})
+                timer.resumed()
+            else:
+                flight, leader = self.flights.join(key, share=self.coalesce)
+                timer.coalesced = not leader
+                if leader:
+                    flight.task = asyncio.ensure_future(
+                        self.pump(flight, session.model, messages, timer))
+                timer.sent()
+                async for delta in flight.subscribe_async():
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    timer.chunk()
+                    reply.append(delta)
+                    # Time spent writing to the client counts as render time
+                    timer.handed_off()
+                    await self.send_event(writer, {"delta": delta})
+                    timer.resumed()
+                timer.model = flight.model
+
+            await self.send_event(writer, {
+                "model": timer.model,
+                "cached": cached is not None,
+                "similarity": similarity,
+                "ttft_s": round(ttft, 4) if ttft is not None else None,
+                "latency_s": round(time.perf_counter() - start, 4),
+            }, event="done")
+        except (ConnectionError, asyncio.CancelledError) as e:
+            # Client went away; leaving the flight below closes the upstream
+            # stream unless other sessions are still reading it
+            error = type(e).__name__
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            try:
+                await self.send_event(writer, {"error": f"{type(e).__name__}: {e}"}, event="error")
+            except ConnectionError:
+                pass
+        finally:
+            if flight is not None:
+                flight.leave()  # Cancels the upstream stream if nobody else is reading
+            if timer is not None:
+                timer.finish(len(reply) // 4, error)
+                self.metrics.record(timer)
+            try:
+                if reply:
+                    text = reply.getvalue()
+                    session.history.append("assistant", text)
+                    if self.store is not None:
+                        # File appends and the SQLite commit run off the event loop;
+                        # the session stays busy so turns are saved in order
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, self.save_turn, session, content, text)
+                else:
+                    session.history.pop()
+            finally:
+                session.busy = False
+                session.last_active = time.monotonic()
+                if self.sessions.get(session.id) is session:
+                    self.resident_bytes += session.memory_bytes - memory_before
+                    await self.enforce_memory_limit()
+
+
+async def serve(args):
+    api_key = Chatbot.load_api_key()
+    if not api_key or api_key == 'YOUR_API_KEY_HERE':
+        print("[WARNING] No valid API key found! Set TOGETHER_API_KEY or add it to .env")
+        return 1
+
+    model = MODELS.get(args.model, args.model)
+    if args.max_memory and args.sessions is None:
+        args.sessions = ""  # Spilled sessions need somewhere to go
+    server = ChatServer(create_async_client(api_key, args.max_streams), model=model,
+                        max_sessions=args.max_sessions, max_streams=args.max_streams,
+                        idle_timeout=args.idle_timeout, cache=cache_from_args(args),
+                        near_cache=near_cache_from_args(args),
+                        retry_policy=RetryPolicy(max_attempts=max(1, args.retries)),
+                        failover=not args.no_failover, limiter=rate_limiter_from_args(args),
+                        coalesce=not args.no_coalesce, store=session_store_from_args(args),
+                        admin_token=args.admin_token,
+                        max_memory=int(args.max_memory * 1024 * 1024) if args.max_memory else None)
+    listener = await asyncio.start_server(server.handle_connection, args.host, args.port,
+                                          backlog=1024)
+    expiry = asyncio.ensure_future(server.expiry_loop())
+    print(f"[OK] Chat server listening on http://{args.host}:{args.port} (model: {model})")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        expiry.cancel()
+    return 0
+
+
+def parse_args(argv=None):
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="Multi-session AI Chatbot server (SSE)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default="3b",
+                        help=f"default model id or short name ({', '.join(MODELS)})")
+    parser.add_argument("--max-sessions", type=int, default=10000,
+                        help="maximum resident sessions (default: 10000)")
+    parser.add_argument("--max-streams", type=int, default=256,
+                        help="maximum concurrent upstream streams (default: 256)")
+    parser.add_argument("--idle-timeout", type=float, default=1800,
+                        help="seconds before an idle session leaves memory; with --sessions it "
+                             "is restored from disk on its next request (default: 1800)")
+    parser.add_argument("--max-memory", type=float, default=None, metavar="MB",
+                        help="keep resident conversations under this many megabytes by spilling "
+                             "the least recently active idle sessions to disk; implies --sessions")
+    parser.add_argument("--retries", type=int, default=4, metavar="N",
+                        help="attempts to open each upstream stream (default: 4)")
+    parser.add_argument("--no-failover", action="store_true",
+                        help="never switch to another model when the current one keeps failing")
+    parser.add_argument("--admin-token", default=os.getenv("CHATBOT_ADMIN_TOKEN"), metavar="TOKEN",
+                        help="enable GET /sessions and GET /search for requests that send this "
+                             "Bearer token (default: $CHATBOT_ADMIN_TOKEN; off when unset)")
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
+    add_session_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(asyncio.run(serve(parse_args())))
+    except KeyboardInterrupt:
+        print("\n[STOP] Server stopped")
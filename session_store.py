@@ -0,0 +1,261 @@
+"""
+Persistent conversation store
+Each session is an append-only log of length-prefixed JSON records plus a
+fixed-width offset index (offset, length, tokens) that is memory-mapped to
+find the tail of a conversation that fits a token budget without reading
+the rest. A SQLite database lists the sessions and holds an inverted index
+of message keywords, so past sessions can be searched without loading any
+transcript.
+"""
+
+import json
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+
+LENGTH = struct.Struct("<I")        # log record prefix: payload length
+INDEX_RECORD = struct.Struct("<QII")  # index record: log offset, record length, tokens
+
+SESSION_ID_PATTERN = re.compile(r"^[0-9A-Za-z_-]{1,64}$")
+WORD_PATTERN = re.compile(r"\w{2,}")
+
+# Words too common to be worth indexing
+STOPWORDS = frozenset("""
+a an and are as at be but by can do for from has have how i if in is it me my no not of
+on or so that the this to was we what when where which who why will with you your
+""".split())
+
+
+def default_store_path():
+    """Per-user directory for saved conversations"""
+    return os.path.join(os.path.expanduser('~'), '.ai_chatbot', 'sessions')
+
+
+def keywords(text):
+    """Distinct lower-case index terms of a text"""
+    return {word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS}
+
+
+def snippet(text, terms, width=80):
+    """A short excerpt of text around the first matching term"""
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms if lowered.find(term) >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    excerpt = " ".join(text[start:start + width].split())
+    return ("..." if start else "") + excerpt + ("..." if start + width < len(text) else "")
+
+
+class SessionStore:
+    """Append-only session logs with mmap-able offset indexes and keyword search"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "index.db"), check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, title TEXT, model TEXT, system TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL, messages INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL, session TEXT NOT NULL, seq INTEGER NOT NULL,"
+            " PRIMARY KEY (term, session, seq)) WITHOUT ROWID;"
+        )
+        self._db.commit()
+
+    # Files
+
+    def _files(self, session_id):
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        base = os.path.join(self.path, session_id)
+        return base + ".log", base + ".idx"
+
+    def _count(self, index_path):
+        """Complete index records (a torn final record from a crash is ignored)"""
+        try:
+            return os.path.getsize(index_path) // INDEX_RECORD.size
+        except OSError:
+            return 0
+
+    def _read_index(self, index_path, start, stop):
+        """Index records [start, stop) read through a memory map"""
+        if stop <= start:
+            return []
+        with open(index_path, "rb") as f:
+            with mmap.mmap(f.fileno(), stop * INDEX_RECORD.size, access=mmap.ACCESS_READ) as index:
+                return [INDEX_RECORD.unpack_from(index, i * INDEX_RECORD.size)
+                        for i in range(start, stop)]
+
+    def _read_messages(self, log_path, records):
+        """Decode the log records described by consecutive index records"""
+        if not records:
+            return []
+        first = records[0][0]
+        last_offset, last_length, _ = records[-1]
+        with open(log_path, "rb") as f:
+            f.seek(first)
+            data = f.read(last_offset + last_length - first)
+        messages = []
+        for offset, length, _ in records:
+            start = offset - first + LENGTH.size
+            record = json.loads(data[start:offset - first + length].decode("utf-8"))
+            messages.append({"role": record["r"], "content": record["c"]})
+        return messages
+
+    # Sessions
+
+    def create(self, session_id=None, title=None, model=None, system=None):
+        """Register a new session (a no-op if the id exists) and return its id"""
+        session_id = session_id or uuid.uuid4().hex[:12]
+        self._files(session_id)  # Validates the id
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO sessions (id, title, model, system, created, updated, messages)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (session_id, " ".join((title or "").split())[:80], model, system, now, now))
+            self._db.commit()
+        return session_id
+
+    def info(self, session_id):
+        """Title, model, system prompt and counts of a session, or None if unknown"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, title, model, system, created, updated, messages FROM sessions"
+                " WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return
+        return dict(zip(("id", "title", "model", "system", "created", "updated", "messages"), row))
+
+    def resolve(self, prefix):
+        """Full id of the session starting with prefix ("last" for the most recent), or None"""
+        with self._lock:
+            if prefix == "last":
+                row = self._db.execute(
+                    "SELECT id FROM sessions ORDER BY updated DESC LIMIT 1").fetchone()
+                return row[0] if row else None
+            if not SESSION_ID_PATTERN.match(prefix):
+                return
+            rows = self._db.execute("SELECT id FROM sessions WHERE substr(id, 1, ?) = ? LIMIT 2",
+                                    (len(prefix), prefix)).fetchall()
+        # Ambiguous prefixes resolve to nothing rather than to the wrong session
+        return rows[0][0] if len(rows) == 1 else None
+
+    def sessions(self, limit=20):
+        """Most recently updated sessions"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, title, model, created, updated, messages FROM sessions"
+                " ORDER BY updated DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(zip(("id", "title", "model", "created", "updated", "messages"), row))
+                for row in rows]
+
+    def delete(self, session_id):
+        """Remove a session, its files and its index entries"""
+        with self._lock:
+            for path in self._files(session_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.execute("DELETE FROM postings WHERE session = ?", (session_id,))
+            self._db.commit()
+
+    # Messages
+
+    def append(self, session_id, role, content, tokens):
+        """Append one message and its token count; returns its sequence number"""
+        log_path, index_path = self._files(session_id)
+        payload = json.dumps({"r": role, "c": content, "t": round(time.time(), 3)},
+                             ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            seq = self._count(index_path)
+            with open(log_path, "ab") as log:
+                offset = log.tell()
+                log.write(LENGTH.pack(len(payload)) + payload)
+            # The index is written last: a crash in between leaves an unindexed
+            # log tail that is simply never referenced
+            with open(index_path, "r+b" if os.path.exists(index_path) else "wb") as index:
+                index.seek(seq * INDEX_RECORD.size)
+                index.write(INDEX_RECORD.pack(offset, LENGTH.size + len(payload), tokens))
+                index.truncate()
+            self._db.executemany("INSERT OR IGNORE INTO postings (term, session, seq) VALUES (?, ?, ?)",
+                                 [(term, session_id, seq) for term in keywords(content)])
+            self._db.execute("UPDATE sessions SET updated = ?, messages = ? WHERE id = ?",
+                             (time.time(), seq + 1, session_id))
+            self._db.commit()
+        return seq
+
+    def count(self, session_id):
+        return self._count(self._files(session_id)[1])
+
+    def read(self, session_id, start=0, stop=None):
+        """Messages [start, stop) of a session"""
+        log_path, index_path = self._files(session_id)
+        with self._lock:
+            total = self._count(index_path)
+            stop = total if stop is None else min(stop, total)
+            records = self._read_index(index_path, start, stop)
+            return self._read_messages(log_path, records)
+
+    def tail(self, session_id, token_budget):
+        """The newest messages whose estimated tokens fit in token_budget (at least one)"""
+        log_path, index_path = self._files(session_id)
+        with self._lock:
+            total = self._count(index_path)
+            if not total:
+                return []
+            with open(index_path, "rb") as f:
+                with mmap.mmap(f.fileno(), total * INDEX_RECORD.size,
+                               access=mmap.ACCESS_READ) as index:
+                    start = total
+                    used = 0
+                    # Walk backwards through token counts only; no message is read yet
+                    while start > 0:
+                        _, _, tokens = INDEX_RECORD.unpack_from(index, (start - 1) * INDEX_RECORD.size)
+                        if used + tokens > token_budget and start < total:
+                            break
+                        used += tokens
+                        start -= 1
+            records = self._read_index(index_path, start, total)
+            return self._read_messages(log_path, records)
+
+    # Search
+
+    def search(self, query, limit=10):
+        """Messages containing every keyword of query, newest sessions first"""
+        terms = sorted(keywords(query))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT p.session, p.seq, s.title, s.updated FROM postings p"
+                " JOIN sessions s ON s.id = p.session"
+                f" WHERE p.term IN ({placeholders})"
+                " GROUP BY p.session, p.seq HAVING COUNT(*) = ?"
+                " ORDER BY s.updated DESC, p.seq DESC LIMIT ?",
+                terms + [len(terms), limit]).fetchall()
+        results = []
+        for session_id, seq, title, updated in rows:
+            # Only the matching message is read from disk
+            message = self.read(session_id, seq, seq + 1)
+            if not message:
+                continue
+            results.append({"session": session_id, "seq": seq, "title": title,
+                            "updated": updated, "role": message[0]["role"],
+                            "snippet": snippet(message[0]["content"], terms)})
+        return results
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None